@@ -0,0 +1,124 @@
+"""Headless batch runner, answers the queries of scenario files saved by the application.
+
+    python -m backend [--engine ENGINE] [--workers N] [--cache PATH] [--bypass-cache]
+                      [--frontier-memory N] [--frontier-total N] [FILE|GLOB|-] ...
+
+Prints one JSON line per query, in the order of the files and of their queries, and exits with 1 if a file
+could not be read or parsed. Without files, or with -, one scenario is read from stdin.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+from backend.base.query import ENGINES
+from backend.base.spill import FrontierBudget
+from backend.cache import ResultCache
+from backend.master import parse_data, run_queries, run_cached
+
+STDIN = '-'
+
+
+def expand(patterns: Iterable[str]) -> List[str]:
+    """files matching the patterns in order, each once, patterns without wildcards are file names"""
+    out = []
+    for pattern in patterns:
+        magic = pattern != STDIN and glob.has_magic(pattern)
+        out.extend(sorted(glob.glob(pattern, recursive=True)) if magic else [pattern])
+    return list(dict.fromkeys(out))
+
+
+def run_file(
+        name: str, text: str = None, engine: str = None, cache: str = None, bypass: bool = False,
+        budget: FrontierBudget = None
+) -> List[dict]:
+    """result lines of the queries of a scenario file, or a single line with the error of the file"""
+    start = time.perf_counter()
+    try:
+        if text is None:
+            with open(name) as f:
+                text = f.read()
+        data = json.loads(text)
+        if cache is None:
+            results = run_queries(parse_data(data), engine=engine, budget=budget)
+        else:
+            results = run_cached(data, cache=_cache(cache), engine=engine, bypass=bypass, budget=budget)
+    except Exception as e:
+        return [{'file': name, 'error': getattr(e, 'message', repr(e)), 'seconds': time.perf_counter() - start}]
+    seconds = time.perf_counter() - start
+    queries = data.get('QUERY', [])
+    return [
+        {
+            'file': name, 'query': i, 'expression': queries[i - 1].get('original_expression'),
+            'result': result, 'seconds': seconds,
+        }
+        for i, result in results.items()
+    ]
+
+
+# result cache of the process, opened on first use so every worker has its own connection
+_caches = {}
+
+
+def _cache(path: str) -> ResultCache:
+    if path not in _caches:
+        _caches[path] = ResultCache(path=path)
+    return _caches[path]
+
+
+def _run_file(args: Tuple[str, str, str, str, bool, FrontierBudget]) -> List[dict]:
+    return run_file(*args)
+
+
+def run_files(
+        names: List[str], engine: str = None, workers: int = 1, cache: str = None, bypass: bool = False,
+        stdin: str = None, budget: FrontierBudget = None
+) -> Iterator[List[dict]]:
+    """result lines of every file, in order of the files, answered in a pool of workers processes if workers > 1"""
+    tasks = [(name, stdin if name == STDIN else None, engine, cache, bypass, budget) for name in names]
+    if workers <= 1 or len(tasks) < 2:
+        yield from map(_run_file, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        # map keeps the order of the files and yields each as soon as it and the files before it are done
+        yield from pool.map(_run_file, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m backend', description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*', default=[STDIN], help='scenario files or globs, - for stdin')
+    parser.add_argument('--engine', choices=ENGINES, default=None, help='simulation engine of every query')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='files answered at once')
+    parser.add_argument('--cache', default=None, help='SQLite file of the result cache, no cache by default')
+    parser.add_argument('--bypass-cache', action='store_true', help='run every query and refresh the cache')
+    parser.add_argument('--frontier-memory', type=int, default=None,
+                        help='models of a frontier kept in memory, the others are spilled to disk')
+    parser.add_argument('--frontier-total', type=int, default=None,
+                        help='models of a frontier in total, a query with more fails')
+    args = parser.parse_args(argv)
+
+    budget = None
+    if args.frontier_memory is not None or args.frontier_total is not None:
+        default = FrontierBudget()
+        memory = default.memory if args.frontier_memory is None else args.frontier_memory
+        total = max(memory, default.total) if args.frontier_total is None else args.frontier_total
+        budget = FrontierBudget(memory=memory, total=total)
+
+    names = expand(args.files)
+    stdin = sys.stdin.read() if STDIN in names else None
+    status = 0
+    for lines in run_files(names, args.engine, args.workers, args.cache, args.bypass_cache, stdin, budget):
+        for line in lines:
+            status = 1 if 'error' in line else status
+            print(json.dumps(line), flush=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
-from .exception import BackendException, ParsingException, LogicException
+from .exception import BackendException, ParsingException, LogicException, BudgetException
 from .agent import Agent
 from .state import State
 from .formula import Formula, Operator
 from .statement import Statement, ReleaseStatement, EffectStatement
 from .timepoint import TimePoint, Obs
+from .mask import Vocabulary, MaskObs
+from .bdd import BDD
 from .scenario import Scenario
 from .action import Action
-from .query import ActionQuery, FormulaQuery, AgentQuery, Query
+from .query import ActionQuery, FormulaQuery, AgentQuery, Query, TransitionCache, run_batch
+from .spill import FrontierBudget
+from .graph import StateGraph, FrontierGraph
+from .checkpoint import Checkpoints
+from .stats import Stats, collect
@@ -1,11 +1,10 @@
 from __future__ import annotations
 
-from copy import deepcopy as copy
 from dataclasses import dataclass
-from typing import List
+from typing import List, Tuple
 
 from . import ParsingException
-from . import timepoint as tp, statement as st, state as state, formula, exception as exc
+from . import timepoint as tp, statement as st, state as state, formula, exception as exc, mask, bdd, stats
 
 
 @dataclass(slots=True)
@@ -21,51 +20,69 @@ class Action:
         return out
 
     def run(
-            self, obs: tp.Obs, statements: List[st.Statement]
-    ) -> List[tp.Obs]:
+            self, obs: tp.Obs | mask.MaskObs, statements: List[st.Statement]
+    ) -> List[tp.Obs | mask.MaskObs]:
         """run action by agent if """
-        causes_satisfied: int = 0
-        causes_structure = []
+        if not isinstance(obs, mask.MaskObs):
+            vocabulary = mask.Vocabulary.from_states(obs.states)
+            return [new_obs.to_obs() for new_obs in self.run(vocabulary.encode(obs.states), statements)]
+        return self.step(
+            obs,
+            tuple(_statement for _statement in statements if isinstance(_statement, st.EffectStatement)),
+            tuple(_statement for _statement in statements if isinstance(_statement, st.ReleaseStatement))
+        )
 
-        for _statement in filter(lambda x: isinstance(x, st.EffectStatement), statements):
-            if _statement.precondition.bool(obs=obs):
-                causes_satisfied += 1
-                if causes_satisfied <= 1:
-                    causes_structure.append(_statement.formula.structure)
-                else:
-                    causes_structure.extend(["and", _statement.formula.structure])
+    def step(
+            self, obs: mask.MaskObs, effects: Tuple[st.EffectStatement, ...], releases: Tuple[st.ReleaseStatement, ...]
+    ) -> List[mask.MaskObs]:
+        """run action on statements already split into effects and releases"""
+        postconditions = self.postconditions(
+            obs.vocabulary,
+            [_statement for _statement in effects if _statement.bool(obs=obs)],
+            [_statement for _statement in releases if _statement.bool(obs=obs)]
+        )
+        if stats.current is not None:
+            stats.current.transitions += 1
+            stats.current.outcomes += len(postconditions)
+        # update states with all postconditions that can be applied
+        return [obs.apply(set_, clear) for set_, clear in postconditions]
 
-        postconditions: List[List[state.State]] = [possibility.states for possibility in
-                                                   formula.Formula(causes_structure).get_all_possibilities()]
+    @staticmethod
+    def postconditions(
+            vocabulary: mask.Vocabulary, effects: List[st.EffectStatement], releases: List[st.ReleaseStatement]
+    ) -> List[Tuple[int, int]]:
+        """(set mask, clear mask) pairs of every outcome of the statements that fired, empty if none did"""
+        manager = bdd.manager_for(vocabulary)
 
-        for _statement in filter(lambda x: isinstance(x, st.ReleaseStatement), statements):
-            if _statement.precondition.bool(obs=obs):
-                if postconditions:
-                    psc: List[List[state.State]] = []
-                    old_postconditions = copy(postconditions)
-                    postconditions = []
-                    for postcondition in old_postconditions:
-                        if _statement.postcondition in postcondition:
-                            continue
-                        temp = copy(postcondition)
-                        temp2 = copy(postcondition)
-                        temp.append(state.State(_statement.postcondition.name, False))
-                        temp2.append(state.State(_statement.postcondition.name, True))
-                        psc.extend([temp, temp2])
-                    postconditions.extend(psc)
-                else:
-                    psc = _statement.postcondition
-                    psc2 = state.State(name=psc.name, holds=not psc.holds)
-                    postconditions.extend([[psc], [psc2]])
+        postconditions: List[Tuple[int, int]] = []
+        if effects:
+            causes, over = bdd.TRUE, 0
+            for _statement in effects:
+                causes = manager.and_(causes, _statement.formula.to_bdd(manager))
+                over |= _statement.formula.fluents_mask(manager)
+            postconditions = [(value, over & ~value) for value in manager.assignments(causes, over)]
 
-        new_obs = []
-        for postcondition in postconditions:
-            # update states with all postconditions that can be applied
-            temp = tp.Obs(states=copy(obs.states))
-            temp |= tp.Obs(states=postcondition)
-            new_obs.append(temp)
+        for _statement in releases:
+            released = _statement.postcondition
+            bit = 1 << manager.level(released.name)
+            if postconditions:
+                postconditions = [
+                    variant
+                    for set_, clear in postconditions if not (set_ if released.holds else clear) & bit
+                    for variant in ((set_, clear | bit), (set_ | bit, clear))
+                ]
+            else:
+                postconditions = [(bit, 0), (0, bit)] if released.holds else [(0, bit), (bit, 0)]
 
-        return new_obs
+        for set_, clear in postconditions:
+            if set_ & clear:
+                raise exc.LogicException('Scenario is not realizable - statement contains disjoint statements')
+            if (set_ | clear) & ~vocabulary.full:
+                raise exc.LogicException("Not all states were defined in Obs.")
+        return postconditions
 
     def __eq__(self, other: Action) -> bool:
         return self.name == other.name
+
+    def __hash__(self) -> int:
+        return hash(self.name)
@@ -21,3 +21,6 @@ class Agent:
 
     def __eq__(self, other) -> bool:
         return self.name == other.name
+
+    def __hash__(self) -> int:
+        return hash(self.name)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+from . import mask
+
+FALSE = 0
+TRUE = 1
+
+# level of the terminal nodes, below every variable
+_TERMINAL = 1 << 30
+# nodes with at most this many satisfying assignments over their support are tested with a set of them
+_ACCEPTED_MAX = 1 << 12
+
+
+class BDD:
+    """Reduced ordered binary decision diagram manager.
+
+    Variables are ordered like the fluents of the vocabulary, variable i is bit i of MaskObs.value.
+    Fluents outside the vocabulary get levels after it when first used.
+    Nodes are ints, FALSE and TRUE are the terminals.
+    """
+
+    def __init__(self, vocabulary: mask.Vocabulary):
+        self.vocabulary = vocabulary
+        self.names: List[str] = list(vocabulary.names)
+        self.levels: Dict[str, int] = dict(vocabulary.index)
+        self._level: List[int] = [_TERMINAL, _TERMINAL]
+        self._low: List[int] = [FALSE, TRUE]
+        self._high: List[int] = [FALSE, TRUE]
+        self._unique: Dict[Tuple[int, int, int], int] = {}
+        self._computed: Dict[Tuple[int, int, int], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._level)
+
+    def level(self, name: str) -> int:
+        level = self.levels.get(name)
+        if level is None:
+            level = self.levels[name] = len(self.names)
+            self.names.append(name)
+        return level
+
+    def mk(self, level: int, low: int, high: int) -> int:
+        if low == high:
+            return low
+        key = (level, low, high)
+        node = self._unique.get(key)
+        if node is None:
+            node = self._unique[key] = len(self._level)
+            self._level.append(level)
+            self._low.append(low)
+            self._high.append(high)
+        return node
+
+    def var(self, name: str) -> int:
+        return self.mk(self.level(name), FALSE, TRUE)
+
+    def ite(self, f: int, g: int, h: int) -> int:
+        if f == TRUE:
+            return g
+        if f == FALSE:
+            return h
+        if g == h:
+            return g
+        if g == TRUE and h == FALSE:
+            return f
+        key = (f, g, h)
+        node = self._computed.get(key)
+        if node is not None:
+            return node
+
+        level = min(self._level[f], self._level[g], self._level[h])
+        f0, f1 = self._cofactors(f, level)
+        g0, g1 = self._cofactors(g, level)
+        h0, h1 = self._cofactors(h, level)
+        node = self._computed[key] = self.mk(level, self.ite(f0, g0, h0), self.ite(f1, g1, h1))
+        return node
+
+    def _cofactors(self, node: int, level: int) -> Tuple[int, int]:
+        if self._level[node] != level:
+            return node, node
+        return self._low[node], self._high[node]
+
+    def not_(self, f: int) -> int:
+        return self.ite(f, FALSE, TRUE)
+
+    def and_(self, f: int, g: int) -> int:
+        return self.ite(f, g, FALSE)
+
+    def or_(self, f: int, g: int) -> int:
+        return self.ite(f, TRUE, g)
+
+    def implies_(self, f: int, g: int) -> int:
+        return self.ite(f, g, TRUE)
+
+    def if_and_only_if_(self, f: int, g: int) -> int:
+        return self.ite(f, g, self.not_(g))
+
+    def from_tree(self, tree: tuple) -> int:
+        kind = tree[0]
+        if kind == 'fluent':
+            return self.var(tree[1])
+        if kind == 'const':
+            return TRUE if tree[1] else FALSE
+        if kind == 'not':
+            return self.not_(self.from_tree(tree[1]))
+        f, g = self.from_tree(tree[1]), self.from_tree(tree[2])
+        if kind == 'and':
+            return self.and_(f, g)
+        if kind == 'or':
+            return self.or_(f, g)
+        if kind == 'implies':
+            return self.implies_(f, g)
+        return self.if_and_only_if_(f, g)
+
+    def evaluate(self, node: int, value: int) -> bool:
+        """truth value of node for the assignment packed in value"""
+        level, low, high = self._level, self._low, self._high
+        while node > TRUE:
+            node = high[node] if value >> level[node] & 1 else low[node]
+        return node == TRUE
+
+    def support(self, node: int) -> int:
+        """mask of the variables the node depends on"""
+        seen, out, stack = set(), 0, [node]
+        while stack:
+            node = stack.pop()
+            if node <= TRUE or node in seen:
+                continue
+            seen.add(node)
+            out |= 1 << self._level[node]
+            stack.extend((self._low[node], self._high[node]))
+        return out
+
+    def assignments(self, node: int, over: int) -> Iterator[int]:
+        """satisfying assignments of node over the variables of the mask over, packed like MaskObs.value.
+
+        Variables of over the node does not depend on take both values, so over must contain the support.
+        """
+        levels = [level for level in range(over.bit_length()) if over >> level & 1]
+
+        def walk(node: int, k: int, value: int) -> Iterator[int]:
+            if node == FALSE:
+                return
+            if k == len(levels):
+                if node != TRUE:
+                    raise ValueError('Assignment does not cover the support of the node.')
+                yield value
+                return
+            level = levels[k]
+            if self._level[node] < level:
+                raise ValueError('Assignment does not cover the support of the node.')
+            low, high = self._cofactors(node, level)
+            yield from walk(high, k + 1, value | 1 << level)
+            yield from walk(low, k + 1, value)
+
+        return walk(node, 0, 0)
+
+    def count(self, node: int, over: int) -> int:
+        """number of satisfying assignments of node over the variables of the mask over"""
+        levels = [level for level in range(over.bit_length()) if over >> level & 1]
+        position = {level: k for k, level in enumerate(levels)}
+        memo: Dict[int, int] = {}
+
+        def below(node: int) -> int:
+            return len(levels) if node <= TRUE else position[self._level[node]]
+
+        def walk(node: int) -> int:
+            if node <= TRUE:
+                return node
+            if node not in memo:
+                k = position[self._level[node]]
+                low, high = self._low[node], self._high[node]
+                memo[node] = (walk(low) << (below(low) - k - 1)) + (walk(high) << (below(high) - k - 1))
+            return memo[node]
+
+        return walk(node) << below(node)
+
+
+class Acceptance:
+    """Membership test of packed values in the set of a node, built once per node.
+
+    A node with few satisfying assignments over its support keeps them in a set, so a test is one lookup
+    of the value masked to the support. Larger ones are tested by walking the node.
+    """
+    __slots__ = ('manager', 'node', 'support', 'accepted')
+
+    def __init__(self, manager: BDD, node: int):
+        self.manager = manager
+        self.node = node
+        self.support = manager.support(node)
+        self.accepted = frozenset(manager.assignments(node, self.support)) \
+            if manager.count(node, self.support) <= _ACCEPTED_MAX else None
+
+    def __call__(self, value: int) -> bool:
+        if self.accepted is None:
+            return self.manager.evaluate(self.node, value)
+        return value & self.support in self.accepted
+
+    def assignments(self, over: int) -> Iterator[int]:
+        """accepted values over the variables of the mask over, which must contain the support"""
+        if self.accepted is None or self.support & ~over:
+            yield from self.manager.assignments(self.node, over)
+            return
+        if not self.accepted:
+            return
+        free = over & ~self.support
+        subset = free
+        while True:
+            for value in self.accepted:
+                yield value | subset
+            if subset == 0:
+                return
+            subset = (subset - 1) & free
+
+
+@lru_cache(maxsize=32)
+def manager_for(vocabulary: mask.Vocabulary) -> BDD:
+    return BDD(vocabulary)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from . import Statement, ReleaseStatement
+from .query import Query, QuasiModel, TransitionCache
+
+
+@dataclass(slots=True)
+class Checkpoints:
+    """Models of a simulation after every timepoint, keyed by a hash of the scenario up to that timepoint.
+
+    A simulation resumes from the last checkpoint of the longest prefix it shares with earlier ones. Only the
+    checkpoints of the last simulated scenario are kept, at most maxsize of them, the others are stale.
+    """
+    maxsize: int = 256
+    # timepoints resumed from a checkpoint and timepoints simulated
+    hits: int = 0
+    misses: int = 0
+    _entries: Dict[str, List[QuasiModel]] = field(default_factory=dict, repr=False)
+
+    def simulate(self, query: Query, transitions: TransitionCache = None) -> List[QuasiModel]:
+        """models of the query (paths engine), simulated from the last matching checkpoint"""
+        timepoints = query.timepoints()
+        keys = prefix_keys(query)
+        start = next((k for k in range(len(keys) - 1, -1, -1) if keys[k] in self._entries), None)
+        entries = {}
+        if start is None:
+            models = query.initial_models()
+            start = 0
+        else:
+            models = self._entries[keys[start]]
+            self.hits += start
+        for k in range(start + 1):
+            if keys[k] in self._entries:
+                entries[keys[k]] = self._entries[keys[k]]
+        entries[keys[start]] = models
+
+        transitions = TransitionCache(query.scenario) if transitions is None else transitions
+        try:
+            for k in range(start, len(timepoints)):
+                models = Query.run(query, transitions, models, k, k + 1)
+                self.misses += 1
+                entries[keys[k + 1]] = models
+        finally:
+            # latest prefixes first, edits near the end of a scenario are resumed from the closest checkpoint
+            self._entries = dict(list(entries.items())[-self.maxsize:])
+        return models
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def prefix_keys(query: Query) -> List[str]:
+    """hashes of the scenario of the query up to every timepoint, the first one covers the initial models,
+    which are given by the states and the first timepoint even past termination, and the statements"""
+    digest = hashlib.sha1(repr((
+        tuple(_state.name for _state in query.states or []),
+        [_statement_key(_statement) for _statement in query.scenario.statements],
+        next(iter(query.scenario.timepoints.values()), None)
+    )).encode())
+    keys = [digest.hexdigest()]
+    for timepoint in query.timepoints():
+        digest.update(repr(timepoint).encode())
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def _statement_key(_statement: Statement) -> tuple:
+    """fields defining a statement, its repr also shows values computed on first use"""
+    if isinstance(_statement, ReleaseStatement):
+        effect = _statement.postcondition.name, _statement.postcondition.holds
+    else:
+        effect = _statement.formula.structure
+    return (
+        type(_statement).__name__, _statement.action.name, None if _statement.agent is None else _statement.agent.name,
+        _statement.precondition.structure if _statement.precondition is not None else None, effect
+    )
@@ -8,3 +8,7 @@ class ParsingException(BackendException):
 
 class LogicException(BackendException):
     pass
+
+
+class BudgetException(LogicException):
+    pass
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
-import itertools
+from collections.abc import Sequence
+
+import numpy as np
 
 from . import State
-from . import timepoint as tp
+from . import timepoint as tp, mask, bdd, stats
 
 from . import exception as exc
 from dataclasses import field, dataclass
-from typing import Union, List, Iterable
+from typing import Callable, Dict, Union, List, Iterable, Tuple
+
+# formulas with at most this many fluents are enumerated without numpy, the call overhead dominates there
+_NUMPY_MIN_STATES = 7
+# number of assignments evaluated at once, bounds the size of the column arrays
+_CHUNK = 1 << 20
 
 
 class Operator:
@@ -56,16 +63,62 @@ def flatten(items):
             yield x
 
 
-def _get_all_possibilities(states: List[str]) -> List[tp.Obs]:
-    return [
-        tp.Obs([
-            State(state_name, holds=permutation[i]) for i, state_name in enumerate(states)
-        ]) for permutation in itertools.product([True, False], repeat=len(states))]
+@dataclass(slots=True, eq=False)
+class Possibilities(Sequence):
+    """Satisfying assignments of a formula packed as integers, bit i is set when names[i] holds.
+
+    Assignments are enumerated on first use and Obs objects are only built for the elements that are accessed.
+    """
+    names: Tuple[str, ...]
+    tree: tuple = None
+    _masks: np.ndarray = None
+
+    @property
+    def masks(self) -> np.ndarray:
+        if self._masks is None:
+            self._masks = np.empty(0, dtype=np.uint64) if self.tree is None else \
+                _satisfying_masks(self.tree, list(self.names))
+        return self._masks
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._to_obs(packed) for packed in self.masks[i]]
+        return self._to_obs(self.masks[i])
+
+    def _to_obs(self, packed) -> tp.Obs:
+        packed = int(packed)
+        return tp.Obs(states=[State(name, holds=bool(packed >> i & 1)) for i, name in enumerate(self.names)])
+
+    def encode(self, vocabulary: mask.Vocabulary) -> List[mask.MaskObs]:
+        bits = [vocabulary.bit(name) for name in self.names]
+        if None in bits:
+            return []
+        known = sum(bits)
+        out = []
+        for packed in self.masks.tolist():
+            value = 0
+            for i, bit in enumerate(bits):
+                if packed >> i & 1:
+                    value |= bit
+            out.append(mask.MaskObs(vocabulary=vocabulary, known=known, value=value))
+        return out
 
 
 @dataclass(slots=True)
 class Formula:
     structure: List[Union[str, str]] = field(default_factory=list)
+    _cache: Dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __getstate__(self):
+        # the cache holds closures and nodes of process-local BDD managers
+        return self.structure,
+
+    def __setstate__(self, state):
+        self.structure, = state
+        self._cache = {}
 
     @classmethod
     def from_ui(cls, data: str) -> Formula:
@@ -83,56 +136,245 @@ class Formula:
         filtered = set(filter(lambda x: x not in keywords, flatten(self.structure)))
         return sorted(list(filtered))
 
-    def get_all_possibilities(self) -> List[tp.Obs]:
-        if self.structure == []:
-            return []
-        states = self.extract_states()
-        true_states = [obs for obs in _get_all_possibilities(states) if self.bool(obs)]
+    def get_all_possibilities(self) -> Possibilities:
+        if stats.current is not None:
+            stats.current.possibilities += 1
+        if not self.structure:
+            return Possibilities(names=())
+        return Possibilities(names=tuple(self.extract_states()), tree=self.tree)
 
-        return true_states
+    def satisfying_masks(self, names: List[str] = None) -> np.ndarray:
+        """All satisfying assignments over names (every fluent of the formula by default) as packed uint64,
+        bit i is set when names[i] holds"""
+        names = self.extract_states() if names is None else names
+        return _satisfying_masks(self.tree, names)
 
-    def bool(self, obs: tp.Obs):
+    @property
+    def tree(self) -> tuple:
+        tree = self._cache.get('tree')
+        if tree is None:
+            tree = self._cache['tree'] = build_tree(self.structure)
+        return tree
 
-        if not self.structure:
-            return True
+    def to_bdd(self, manager: bdd.BDD, strict: bool = True) -> int:
+        """BDD node of the formula, cached on the formula per manager.
 
-        def get_by_name_safe_raise(obs: tp.Obs, element: str | bool) -> State:
-            if isinstance(element, bool):
-                return element
-            el = obs.get_by_name(element)
-            if el is None:
+        Fluents outside the vocabulary of the manager become new variables if strict,
+        or make the formula false otherwise (OBS semantics).
+        """
+        if not strict and self.fluents_mask(manager) & ~manager.vocabulary.full:
+            return bdd.FALSE
+        key = ('bdd', manager)
+        node = self._cache.get(key)
+        if node is None:
+            node = self._cache[key] = bdd.TRUE if not self.structure else manager.from_tree(self.tree)
+        return node
+
+    def acceptance(self, manager: bdd.BDD, strict: bool = True) -> bdd.Acceptance:
+        """membership test of packed values in the formula, built once per manager, see to_bdd for strict"""
+        key = ('acceptance', manager, strict)
+        out = self._cache.get(key)
+        if out is None:
+            out = self._cache[key] = bdd.Acceptance(manager, self.to_bdd(manager, strict))
+        return out
+
+    def fluents_mask(self, manager: bdd.BDD) -> int:
+        """mask of the levels of every fluent mentioned in the formula"""
+        out = 0
+        for name in tree_fluents(self.tree) if self.structure else []:
+            out |= 1 << manager.level(name)
+        return out
+
+    def compile(self, vocabulary: mask.Vocabulary = None, strict: bool = True) -> Callable[[tp.Obs], bool]:
+        """Evaluator of the formula, built once per vocabulary and cached on the formula.
+
+        With a vocabulary the evaluator takes MaskObs, otherwise any Obs. A fluent missing from the
+        obs raises LogicException if strict, or makes the formula false otherwise (OBS semantics).
+        """
+        key = (vocabulary, strict)
+        compiled = self._cache.get(key)
+        if compiled is None:
+            compiled = self._cache[key] = _compile(self.structure, vocabulary, strict)
+        return compiled
+
+    def bool_all(self, values: np.ndarray, vocabulary: mask.Vocabulary, strict: bool = True) -> np.ndarray:
+        """Truth value of the formula for every row of packed MaskObs values of fully known states.
+
+        A fluent outside the vocabulary raises LogicException if strict, or makes the formula false otherwise.
+        """
+        if not self.structure:
+            return np.ones(len(values), dtype=bool)
+        names = tree_fluents(self.tree)
+        if any(vocabulary.bit(name) is None for name in names):
+            if strict:
                 raise exc.LogicException('State in precondition was not found in OBS.')
-            return el
-
-        def _traverse(structure_):
-            last_states = []
-            operator = None
-            if isinstance(structure_, str):
-                structure_ = [structure_]
-            for el in structure_:
-                if isinstance(el, list):
-                    el = _traverse(el)
-
-                if el not in list(Operator.map_methods.keys()):
-                    last_states.append(get_by_name_safe_raise(obs, el))
-                else:
-                    operator = Operator.get(el)
-
-                if len(last_states) > 0 and operator is not None:
-                    if operator.__name__ == "not_":
-                        el = last_states.pop()
-                        last_states.append(operator(el))
-                        operator = None
-                    elif len(last_states) >= 2:
-                        el = last_states.pop()
-                        previous_el = last_states.pop()
-                        last_states.append(operator(previous_el, el))
-                        operator = None
-
-            if operator is not None:
+            return np.zeros(len(values), dtype=bool)
+        columns = {}
+
+        def column(name: str) -> np.ndarray:
+            if name not in columns:
+                columns[name] = values & np.uint64(vocabulary.bit(name)) != 0
+            return columns[name]
+
+        return np.broadcast_to(_evaluate_columns(self.tree, column), values.shape)
+
+    def bool(self, obs: tp.Obs | mask.MaskObs):
+        if stats.current is not None:
+            stats.current.formula_evaluations += 1
+        return self.compile(obs.vocabulary if isinstance(obs, mask.MaskObs) else None)(obs)
+
+
+def build_tree(structure) -> tuple:
+    """Nested tuple tree of a formula structure, built the same way Formula.bool reads the structure"""
+    last_states = []
+    operator = None
+    if isinstance(structure, str):
+        structure = [structure]
+    for el in structure:
+        if isinstance(el, list):
+            last_states.append(build_tree(el))
+        elif isinstance(el, bool):
+            last_states.append(('const', el))
+        elif el in Operator.map_methods:
+            operator = el
+        else:
+            last_states.append(('fluent', el))
+
+        if len(last_states) > 0 and operator is not None:
+            if operator == 'not':
+                last_states.append(('not', last_states.pop()))
+                operator = None
+            elif len(last_states) >= 2:
                 el = last_states.pop()
-                return operator(el)
+                previous_el = last_states.pop()
+                last_states.append((operator, previous_el, el))
+                operator = None
+
+    if operator is not None:
+        if operator != 'not' or not last_states:
+            raise exc.LogicException('Formula is malformed.')
+        return 'not', last_states.pop()
+    if not last_states:
+        raise exc.LogicException('Formula is malformed.')
+    return last_states[0]
+
+
+def tree_fluents(tree: tuple) -> List[str]:
+    if tree[0] == 'fluent':
+        return [tree[1]]
+    if tree[0] == 'const':
+        return []
+    return list(dict.fromkeys(name for child in tree[1:] for name in tree_fluents(child)))
+
+
+def _compile_tree(tree: tuple, slot: Callable[[str], Callable]) -> Callable:
+    kind = tree[0]
+    if kind == 'fluent':
+        return slot(tree[1])
+    if kind == 'const':
+        value = tree[1]
+        return lambda v: value
+    if kind == 'not':
+        f = _compile_tree(tree[1], slot)
+        return lambda v: not f(v)
+
+    f, g = _compile_tree(tree[1], slot), _compile_tree(tree[2], slot)
+    if kind == 'and':
+        return lambda v: f(v) and g(v)
+    if kind == 'or':
+        return lambda v: f(v) or g(v)
+    if kind == 'implies':
+        return lambda v: not f(v) or g(v)
+    return lambda v: f(v) == g(v)
+
+
+def _compile(structure, vocabulary: mask.Vocabulary | None, strict: bool) -> Callable[[tp.Obs], bool]:
+    if not structure:
+        return lambda obs: True
+
+    tree = build_tree(structure)
+    names = tree_fluents(tree)
+
+    def missing(obs) -> bool:
+        if strict:
+            raise exc.LogicException('State in precondition was not found in OBS.')
+        return False
+
+    if vocabulary is None:
+        evaluate_values = _compile_tree(tree, lambda name: lambda values: values[name])
+
+        def evaluate(obs: tp.Obs) -> bool:
+            values = {}
+            for name in names:
+                el = obs.get_by_name(name)
+                if el is None:
+                    return missing(obs)
+                values[name] = bool(el)
+            return evaluate_values(values)
+
+        return evaluate
+
+    if any(vocabulary.bit(name) is None for name in names):
+        return missing
+
+    need = 0
+    for name in names:
+        need |= vocabulary.bit(name)
+    evaluate_value = _compile_tree(tree, lambda name: _bit_slot(vocabulary.bit(name)))
+
+    def evaluate(obs: mask.MaskObs) -> bool:
+        if obs.known & need != need:
+            return missing(obs)
+        return evaluate_value(obs.value)
+
+    return evaluate
+
+
+def _bit_slot(bit: int) -> Callable[[int], bool]:
+    return lambda value: value & bit != 0
+
+
+def _satisfying_masks(tree: tuple, names: List[str]) -> np.ndarray:
+    n = len(names)
+    if n > 62:
+        raise exc.LogicException('Formula has too many fluents to enumerate all possibilities.')
+    index = {name: i for i, name in enumerate(names)}
+    if any(name not in index for name in tree_fluents(tree)):
+        raise exc.LogicException('State in formula was not found in OBS.')
+
+    if n < _NUMPY_MIN_STATES:
+        evaluate = _compile_tree(tree, lambda name: _bit_slot(1 << index[name]))
+        return np.array([packed for packed in range((1 << n) - 1, -1, -1) if evaluate(packed)], dtype=np.uint64)
+
+    chunks = []
+    for start in range(0, 1 << n, _CHUNK):
+        rows = np.arange(start, min(start + _CHUNK, 1 << n), dtype=np.uint64)
+        columns = {}
+
+        def column(name: str) -> np.ndarray:
+            if name not in columns:
+                columns[name] = (rows >> np.uint64(index[name]) & np.uint64(1)).astype(bool)
+            return columns[name]
+
+        chunks.append(rows[np.broadcast_to(_evaluate_columns(tree, column), rows.shape)])
+    return np.concatenate(chunks)[::-1]
+
 
-            return bool(last_states[0])
+def _evaluate_columns(tree: tuple, column: Callable[[str], np.ndarray]) -> np.ndarray:
+    """Evaluates the formula tree on boolean column arrays, one row per assignment"""
+    kind = tree[0]
+    if kind == 'fluent':
+        return column(tree[1])
+    if kind == 'const':
+        return np.bool_(tree[1])
+    if kind == 'not':
+        return ~_evaluate_columns(tree[1], column)
 
-        return _traverse(self.structure)
+    a, b = _evaluate_columns(tree[1], column), _evaluate_columns(tree[2], column)
+    if kind == 'and':
+        return a & b
+    if kind == 'or':
+        return a | b
+    if kind == 'implies':
+        return ~a | b
+    return a == b
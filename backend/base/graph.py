@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import LogicException
+from . import Agent, Scenario, State, Formula, Vocabulary, MaskObs, Action
+from . import bdd
+from . import query as q
+
+# node of the graph: packed MaskObs value and the bitset of the agents whose step changed the state so far
+Node = Tuple[int, int]
+
+
+@dataclass(slots=True)
+class StateGraph:
+    """Layered graph of the distinct states a scenario can be in.
+
+    Layer k holds the nodes at times[k], each mapped to the nodes it becomes in layer k + 1.
+    Nodes that lie on no realizable path are pruned. Agent activity is only tracked if requested,
+    otherwise the active bitset of every node is 0.
+    """
+    vocabulary: Vocabulary
+    agents: Tuple[str, ...] = ()
+    times: List[int] = field(default_factory=list)
+    layers: List[Dict[Node, Tuple[Node, ...]]] = field(default_factory=list)
+    # agents active in every model
+    always_active: int = 0
+
+    @classmethod
+    def build(cls, scenario: Scenario, termination: int, states: List[State],
+              track_agents: bool = False, transitions: q.TransitionCache = None,
+              first_obs: List[MaskObs] = None) -> StateGraph:
+        """graph of the scenario, from the given states at the first timepoint instead of every possible one"""
+        transitions = q.TransitionCache(scenario) if transitions is None else transitions
+        vocabulary = Vocabulary.from_states(states)
+        manager = bdd.manager_for(vocabulary)
+        agents = tuple(dict.fromkeys(
+            timepoint.acs[1].name for timepoint in scenario.timepoints.values() if timepoint.is_acs()
+        )) if track_agents else ()
+        graph = cls(vocabulary=vocabulary, agents=agents, times=[scenario.get_first_t()])
+        first_obs = scenario.first_obs(states=states) if first_obs is None else first_obs
+        current: Dict[Node, Tuple[Node, ...]] = {(obs.value, 0): () for obs in first_obs}
+
+        for t, timepoint in scenario.timepoints.items():
+            if t > termination:
+                break
+
+            if timepoint.is_obs():
+                accepts = timepoint.obs.accepts(manager)
+                current = {node: () for node in current if accepts(node[0])}
+                if len(current) == 0:
+                    raise LogicException(q.NOT_REALIZABLE)
+
+            if not timepoint.is_acs():
+                continue
+
+            action, agent = timepoint.acs
+            bit = 1 << agents.index(agent.name) if track_agents else 0
+
+            steps: Dict[int, Tuple[int, ...]] = {}
+            successors: Dict[Node, Tuple[Node, ...]] = {}
+            for node in current:
+                value, active = node
+                if value not in steps:
+                    results = transitions.run(action, agent, MaskObs(vocabulary=vocabulary, known=vocabulary.full,
+                                                                     value=value))
+                    # a step without effects keeps the state, like a model that is not extended
+                    steps[value] = tuple(dict.fromkeys(obs.value for obs in results)) if results else (value,)
+                current[node] = tuple(
+                    (new_value, active if new_value == value else active | bit) for new_value in steps[value]
+                )
+                successors.update(dict.fromkeys(current[node], ()))
+
+            graph.layers.append(current)
+            graph.times.append(t + 1)
+            current = successors
+
+        graph.layers.append(current)
+        graph._prune()
+        graph.always_active = (1 << len(agents)) - 1
+        for _, active in graph.layers[-1]:
+            graph.always_active &= active
+        return graph
+
+    def _prune(self):
+        """drops the nodes that cannot reach the last layer, the OBS filters only cut the layer they observe"""
+        alive = self.layers[-1]
+        for k in range(len(self.layers) - 2, -1, -1):
+            layer = {}
+            for node, successors in self.layers[k].items():
+                successors = tuple(successor for successor in successors if successor in alive)
+                if successors:
+                    layer[node] = successors
+            self.layers[k] = alive = layer
+
+    def layer_at(self, time: int) -> Optional[int]:
+        """index of the layer holding the states at time, None before the first timepoint"""
+        out = None
+        for k, t in enumerate(self.times):
+            if t > time:
+                break
+            out = k
+        return out
+
+    def states_at(self, time: int) -> Iterable[int]:
+        k = self.layer_at(time)
+        return () if k is None else dict.fromkeys(value for value, _ in self.layers[k])
+
+    def condition_at(self, formula: Formula, time: int) -> Sequence[bool]:
+        """truth value of a query condition for every state at time, an empty condition never holds"""
+        manager = bdd.manager_for(self.vocabulary)
+        condition = formula.to_bdd(manager, strict=False) if formula.structure else bdd.FALSE
+        return [manager.evaluate(condition, value) for value in self.states_at(time)]
+
+    def is_realizable(self) -> bool:
+        return len(self.layers[-1]) != 0
+
+    def is_agent_active(self, agent: Agent) -> bool:
+        """whether the agent changed the state in every model, needs a graph built with track_agents"""
+        if agent.name not in self.agents:
+            return not self.is_realizable()
+        return bool(self.always_active >> self.agents.index(agent.name) & 1)
+
+
+@dataclass(slots=True)
+class FrontierGraph:
+    """StateGraph with every layer kept as numpy arrays, each transition is applied to the whole frontier at once.
+
+    Layer k holds the packed MaskObs values at times[k] and the active agents bitset of every node.
+    States need at most 64 fluents.
+    """
+    vocabulary: Vocabulary
+    agents: Tuple[str, ...] = ()
+    times: List[int] = field(default_factory=list)
+    values: List[np.ndarray] = field(default_factory=list)
+    active: List[np.ndarray] = field(default_factory=list)
+    # agents active in every model
+    always_active: int = 0
+
+    @classmethod
+    def build(cls, scenario: Scenario, termination: int, states: List[State],
+              track_agents: bool = False, first_obs: List[MaskObs] = None) -> FrontierGraph:
+        """graph of the scenario, from the given states at the first timepoint instead of every possible one"""
+        vocabulary = Vocabulary.from_states(states)
+        if len(vocabulary) > 64:
+            raise LogicException('The numpy engine supports at most 64 fluents.')
+        agents = tuple(dict.fromkeys(
+            timepoint.acs[1].name for timepoint in scenario.timepoints.values() if timepoint.is_acs()
+        )) if track_agents else ()
+        graph = cls(vocabulary=vocabulary, agents=agents, times=[scenario.get_first_t()])
+
+        if first_obs is not None:
+            values = np.unique(np.array([obs.value for obs in first_obs], dtype=np.uint64))
+        elif next(iter(scenario.timepoints.values())).is_obs():
+            values = np.fromiter(scenario.first_values(vocabulary), dtype=np.uint64)
+        else:
+            values = np.arange(1 << len(vocabulary), dtype=np.uint64)
+        active = np.zeros(len(values), dtype=np.uint64)
+        # edges of every layer to the next one, as parent and child row indices
+        edges: List[Tuple[np.ndarray, np.ndarray]] = []
+
+        for t, timepoint in scenario.timepoints.items():
+            if t > termination:
+                break
+
+            if timepoint.is_obs():
+                keep = timepoint.obs.formula.bool_all(values, vocabulary, strict=False)
+                values, active = values[keep], active[keep]
+                if len(values) == 0:
+                    raise LogicException(q.NOT_REALIZABLE)
+                if edges:
+                    index = np.cumsum(keep) - 1
+                    parents, children = edges[-1]
+                    kept = keep[children]
+                    edges[-1] = parents[kept], index[children[kept]]
+
+            if not timepoint.is_acs():
+                continue
+
+            action, agent = timepoint.acs
+            bit = np.uint64(1 << agents.index(agent.name) if track_agents else 0)
+            parents, children_values, children_active = _step(
+                action, *scenario.get_statements(action, agent), vocabulary, values, active, bit
+            )
+
+            graph.values.append(values)
+            graph.active.append(active)
+            graph.times.append(t + 1)
+            if not track_agents:
+                values, children = np.unique(children_values, return_inverse=True)
+                active = np.zeros(len(values), dtype=np.uint64)
+            elif len(vocabulary) + len(agents) <= 64:
+                # both columns fit in one word, sorting words is much faster than sorting rows
+                shift = np.uint64(len(vocabulary))
+                keys, children = np.unique(children_values | children_active << shift, return_inverse=True)
+                values, active = keys & np.uint64(vocabulary.full), keys >> shift
+            else:
+                rows, children = np.unique(np.stack([children_values, children_active], axis=1), axis=0,
+                                           return_inverse=True)
+                values, active = rows[:, 0], rows[:, 1]
+            edges.append((parents, children.reshape(-1)))
+
+        graph.values.append(values)
+        graph.active.append(active)
+        graph._prune(edges)
+        graph.always_active = (1 << len(agents)) - 1
+        if len(agents):
+            graph.always_active &= int(np.bitwise_and.reduce(graph.active[-1]))
+        return graph
+
+    def _prune(self, edges: List[Tuple[np.ndarray, np.ndarray]]):
+        """drops the nodes that cannot reach the last layer"""
+        alive = np.ones(len(self.values[-1]), dtype=bool)
+        for k in range(len(edges) - 1, -1, -1):
+            parents, children = edges[k]
+            reaching = np.zeros(len(self.values[k]), dtype=bool)
+            reaching[parents[alive[children]]] = True
+            alive = reaching
+            self.values[k], self.active[k] = self.values[k][alive], self.active[k][alive]
+
+    def layer_at(self, time: int) -> Optional[int]:
+        """index of the layer holding the states at time, None before the first timepoint"""
+        k = int(np.searchsorted(self.times, time, side='right')) - 1
+        return None if k < 0 else k
+
+    def states_at(self, time: int) -> np.ndarray:
+        k = self.layer_at(time)
+        return np.empty(0, dtype=np.uint64) if k is None else np.unique(self.values[k])
+
+    def condition_at(self, formula: Formula, time: int) -> np.ndarray:
+        """truth value of a query condition for every state at time, an empty condition never holds"""
+        states = self.states_at(time)
+        if not formula.structure:
+            return np.zeros(len(states), dtype=bool)
+        return formula.bool_all(states, self.vocabulary, strict=False)
+
+    def is_realizable(self) -> bool:
+        return len(self.values[-1]) != 0
+
+    def is_agent_active(self, agent: Agent) -> bool:
+        """whether the agent changed the state in every model, needs a graph built with track_agents"""
+        if agent.name not in self.agents:
+            return not self.is_realizable()
+        return bool(self.always_active >> self.agents.index(agent.name) & 1)
+
+
+def _step(
+        action: Action, effects, releases, vocabulary: Vocabulary, values: np.ndarray, active: np.ndarray,
+        bit: np.uint64
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Applies the action to every row of the frontier, returns the parent row, value and active agents
+    of every successor.
+
+    Effects with a single outcome are combined as set/clear masks and releases fan out as extra rows,
+    other statements fall back to one postcondition per pattern of fired statements.
+    """
+    manager = bdd.manager_for(vocabulary)
+    literals = [_literals(manager, _statement.formula) for _statement in effects]
+    if None in literals or any(vocabulary.bit(_statement.postcondition.name) is None for _statement in releases):
+        return _step_by_pattern(action, effects, releases, vocabulary, values, active, bit)
+
+    n = len(values)
+    set_, clear = np.zeros(n, dtype=np.uint64), np.zeros(n, dtype=np.uint64)
+    posts, satisfiable = np.zeros(n, dtype=bool), np.ones(n, dtype=bool)
+    for _statement, (effect_set, effect_clear, effect_satisfiable) in zip(effects, literals):
+        on = _statement.precondition.bool_all(values, vocabulary)
+        np.bitwise_or(set_, np.uint64(effect_set), out=set_, where=on)
+        np.bitwise_or(clear, np.uint64(effect_clear), out=clear, where=on)
+        posts |= on
+        if not effect_satisfiable:
+            satisfiable &= ~on
+    # contradicting effects leave no postcondition, like an unsatisfiable conjunction of effects
+    posts &= satisfiable & (set_ & clear == 0)
+    set_ *= posts
+    clear *= posts
+
+    parents = np.arange(n)
+    for _statement in releases:
+        released = _statement.postcondition
+        on = _statement.precondition.bool_all(values, vocabulary)[parents]
+        released_bit = np.uint64(vocabulary.bit(released.name))
+        # postconditions that already give the released fluent its released value are dropped
+        dropped = on & posts & ((set_ if released.holds else clear) & released_bit != 0)
+        fan = on & ~dropped
+        stay = ~on
+        # a state that lost every postcondition is left without any
+        emptied = np.setdiff1d(parents[dropped], parents[fan])
+        parents = np.concatenate([parents[stay], emptied, parents[fan], parents[fan]])
+        zeros = np.zeros(len(emptied), dtype=np.uint64)
+        set_ = np.concatenate([set_[stay], zeros, set_[fan], set_[fan] | released_bit])
+        clear = np.concatenate([clear[stay], zeros, clear[fan] | released_bit, clear[fan]])
+        posts = np.concatenate([posts[stay], zeros.astype(bool), np.ones(2 * np.count_nonzero(fan), dtype=bool)])
+
+    if np.any(set_ & clear):
+        raise LogicException('Scenario is not realizable - statement contains disjoint statements')
+    # a step without effects keeps the state, like a model that is not extended
+    old_values = values[parents]
+    new_values = old_values & ~clear | set_
+    new_active = np.where(new_values != old_values, active[parents] | bit, active[parents])
+    return parents, new_values, new_active
+
+
+def _literals(manager: bdd.BDD, formula: Formula) -> Optional[Tuple[int, int, bool]]:
+    """set mask, clear mask and satisfiability of an effect with at most one outcome, None for any other effect"""
+    over = formula.fluents_mask(manager)
+    if over & ~manager.vocabulary.full:
+        return None
+    node = formula.to_bdd(manager)
+    count = manager.count(node, over)
+    if count == 0:
+        return 0, 0, False
+    if count > 1:
+        return None
+    value = next(manager.assignments(node, over))
+    return value, over & ~value, True
+
+
+def _step_by_pattern(
+        action: Action, effects, releases, vocabulary: Vocabulary, values: np.ndarray, active: np.ndarray,
+        bit: np.uint64
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """_step for any statements, rows whose statements fire alike share one postcondition"""
+    statements = list(effects) + list(releases)
+    if statements:
+        fired = np.stack([_statement.precondition.bool_all(values, vocabulary) for _statement in statements], axis=1)
+        patterns, group = np.unique(fired, axis=0, return_inverse=True)
+        group = group.reshape(-1)
+    else:
+        patterns, group = np.zeros((1, 0), dtype=bool), np.zeros(len(values), dtype=np.int64)
+
+    parents, children_values, children_active = [], [], []
+    for k, pattern in enumerate(patterns):
+        rows = np.flatnonzero(group == k)
+        postconditions = action.postconditions(
+            vocabulary,
+            [_statement for _statement, on in zip(effects, pattern) if on],
+            [_statement for _statement, on in zip(releases, pattern[len(effects):]) if on]
+        )
+        # a step without effects keeps the state, like a model that is not extended
+        for set_, clear in postconditions or [(0, 0)]:
+            new_values = values[rows] & np.uint64(~clear & vocabulary.full) | np.uint64(set_)
+            parents.append(rows)
+            children_values.append(new_values)
+            children_active.append(np.where(new_values != values[rows], active[rows] | bit, active[rows]))
+    if not parents:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64)
+    return np.concatenate(parents), np.concatenate(children_values), np.concatenate(children_active)
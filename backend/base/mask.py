@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import LogicException
+from . import state, timepoint as tp
+
+
+@dataclass(frozen=True, slots=True)
+class Vocabulary:
+    """Maps every fluent of the domain to a bit index"""
+    names: Tuple[str, ...]
+    index: Dict[str, int] = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'index', {name: i for i, name in enumerate(self.names)})
+
+    @classmethod
+    def from_states(cls, states: List[state.State]) -> Vocabulary:
+        return cls(names=tuple(_state.name for _state in states))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def full(self) -> int:
+        return (1 << len(self.names)) - 1
+
+    def bit(self, name: str) -> Optional[int]:
+        i = self.index.get(name)
+        return None if i is None else 1 << i
+
+    def effect(self, states: Iterable[state.State]) -> Tuple[int, int]:
+        """(set mask, clear mask) of a postcondition, validated the same way as Obs |= Obs"""
+        set_, clear = 0, 0
+        unknown = False
+        for _state in states:
+            bit = self.bit(_state.name)
+            if bit is None:
+                unknown = True
+                continue
+            if _state.holds:
+                set_ |= bit
+            else:
+                clear |= bit
+        if set_ & clear:
+            raise LogicException('Scenario is not realizable - statement contains disjoint statements')
+        if unknown:
+            raise LogicException("Not all states were defined in Obs.")
+        return set_, clear
+
+    def encode(self, states: Iterable[state.State]) -> Optional[MaskObs]:
+        """Returns None when one of the states is not part of the vocabulary"""
+        known, value = 0, 0
+        for _state in states:
+            bit = self.bit(_state.name)
+            if bit is None:
+                return None
+            known |= bit
+            if _state.holds:
+                value |= bit
+            else:
+                value &= ~bit
+        return MaskObs(vocabulary=self, known=known, value=value)
+
+    def encode_all(self, observations: Iterable[tp.Obs]) -> List[MaskObs]:
+        encoded = (self.encode(obs.states) for obs in observations)
+        return [obs for obs in encoded if obs is not None]
+
+    def decode(self, known: int, value: int) -> List[state.State]:
+        return [
+            state.State(name=name, holds=bool(value >> i & 1))
+            for i, name in enumerate(self.names) if known >> i & 1
+        ]
+
+    def all_obs(self) -> List[MaskObs]:
+        full = self.full
+        return [MaskObs(vocabulary=self, known=full, value=value) for value in range(full, -1, -1)]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class MaskObs:
+    """Obs stored as (known mask, value mask) over a Vocabulary"""
+    vocabulary: Vocabulary
+    known: int
+    value: int
+
+    @property
+    def states(self) -> List[state.State]:
+        return self.vocabulary.decode(self.known, self.value)
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.known, self.value
+
+    def to_obs(self) -> tp.Obs:
+        return tp.Obs(states=self.states)
+
+    def holds(self, name: str) -> Optional[bool]:
+        i = self.vocabulary.index.get(name)
+        if i is None or not self.known >> i & 1:
+            return None
+        return bool(self.value >> i & 1)
+
+    def get_by_name(self, name: str) -> state.State | None:
+        holds = self.holds(name)
+        return None if holds is None else state.State(name=name, holds=holds)
+
+    def get_state_by_name(self, name: str) -> state.State:
+        _el = self.get_by_name(name)
+        if _el is None:
+            raise LogicException(f"State '{name}' was not found in OBS.")
+        return _el
+
+    def is_superset(self, other: MaskObs | tp.Obs) -> bool:
+        """same semantics as Obs.is_superset - every state of self is present in other"""
+        if not isinstance(other, MaskObs):
+            other = self.vocabulary.encode(other.states)
+            if other is None:
+                return False
+        elif other.vocabulary is not self.vocabulary and other.vocabulary != self.vocabulary:
+            return all(_state in other.states for _state in self.states)
+        return not self.known & ~other.known and not (self.value ^ other.value) & self.known
+
+    def apply(self, set_: int, clear: int) -> MaskObs:
+        return MaskObs(vocabulary=self.vocabulary, known=self.known, value=(self.value & ~clear) | set_)
+
+    def updated(self, states: Iterable[state.State]) -> MaskObs:
+        return self.apply(*self.vocabulary.effect(states))
+
+    def __iter__(self):
+        return iter(self.states)
+
+    def __or__(self, other) -> MaskObs:
+        return self.updated(other)
+
+    __ior__ = __or__
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MaskObs):
+            return self.key == other.key and self.vocabulary == other.vocabulary
+        if isinstance(other, tp.Obs):
+            return other.formula is None and self.states == other.states
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.vocabulary.names, self.known, self.value))
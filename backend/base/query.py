@@ -1,54 +1,115 @@
 from __future__ import annotations
 
-import copy
-from dataclasses import dataclass, astuple
-from typing import List
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
 
 from . import LogicException, ParsingException
-from . import State, Scenario, Agent, Statement, Obs, Action, TimePoint, Formula
+from . import State, Scenario, Agent, Obs, Action, TimePoint, Formula, Vocabulary, MaskObs
+from . import bdd, stats
+from .formula import Possibilities
+from .graph import StateGraph, FrontierGraph
+from .spill import FrontierBudget, SpilledModels
+
+# simulation engines, 'paths' keeps every model, 'graph' only the distinct states of each timepoint,
+# 'dfs' yields the models one at a time so queries can stop at the first witness or counterexample,
+# 'numpy' is the state graph with every frontier transition applied as array operations
+ENGINES = ('paths', 'graph', 'dfs', 'numpy')
+# engines answering from a graph of states instead of the models
+GRAPH_ENGINES = ('graph', 'numpy')
+
+NOT_REALIZABLE = 'This scenario is not realizable'
+
+# scenario of an independent component, its states and their names
+Component = Tuple[Scenario, List[State], FrozenSet[str]]
+
+
+@dataclass(frozen=True, slots=True)
+class PathNode:
+    """Last timepoint of a path, the rest of the path is shared with the parent"""
+    timepoint: TimePoint
+    parent: Optional[PathNode] = None
 
 
 @dataclass(slots=True)
 class QuasiModel:
-    path: List[TimePoint]
+    head: PathNode
+
+    @classmethod
+    def from_path(cls, path: List[TimePoint]) -> QuasiModel:
+        head = None
+        for timepoint in path:
+            head = PathNode(timepoint=timepoint, parent=head)
+        return cls(head=head)
+
+    @property
+    def path(self) -> List[TimePoint]:
+        return list(reversed(list(self.timepoints())))
+
+    def timepoints(self) -> Iterator[TimePoint]:
+        """timepoints of the path, last one first"""
+        node = self.head
+        while node is not None:
+            yield node.timepoint
+            node = node.parent
+
+    def extend(self, timepoint: TimePoint) -> QuasiModel:
+        return QuasiModel(head=PathNode(timepoint=timepoint, parent=self.head))
 
     def get_last_timepoint(self):
-        return self.path[-1]
+        return self.head.timepoint
 
     def is_performing_action_in_t(self, action: Action, time: int) -> bool:
-        for timepoint in self.path:
-            if timepoint.t - 1 == time and timepoint.acs[0] == action:
+        for timepoint in self.timepoints():
+            if timepoint.t - 1 == time and timepoint.acs is not None and timepoint.acs[0] == action:
                 return True
         return False
 
     def is_agent_active(self, agent: Agent) -> bool:
-        prev_timepoint = None
-        for timepoint in self.path:
+        node = self.head
+        while node.parent is not None:
+            timepoint = node.timepoint
             if timepoint.acs is not None and \
                     timepoint.acs[1] == agent and \
-                    set(astuple(state) for state in prev_timepoint.obs.states) != \
-                    set(astuple(state) for state in timepoint.obs.states):
+                    node.parent.timepoint.obs != timepoint.obs:
                 return True
-            prev_timepoint = timepoint
+            node = node.parent
         return False
 
-    def condition_holds(self, possibilities: List[Obs], time: int) -> bool:
-        fluents = None
-        for timepoint in self.path:
-            if timepoint.t <= time:
-                fluents = Obs(
-                    states=[
-                        timepoint.obs.get_state_by_name(state.name)
-                        for state in possibilities[0].states
-                    ])
+    def condition_holds(self, possibilities: List[MaskObs], time: int) -> bool:
+        fluents = next((timepoint.obs for timepoint in self.timepoints() if timepoint.t <= time), None)
 
-        return False if fluents is None else any(fluents.is_superset(possibility) for possibility in possibilities)
+        return False if fluents is None else any(possibility.is_superset(fluents) for possibility in possibilities)
 
 
-def get_statements(action, agent, statements) -> List[Statement]:
-    filtered_statements = list(
-        filter(lambda x: x.action == action and x.agent == agent, statements))
-    return filtered_statements
+@dataclass(slots=True)
+class TransitionCache:
+    """Bounded LRU cache of Action.run results for the statements of one scenario.
+
+    Keys are the obs, the action name and the agent name, so queries of a run share the transitions.
+    """
+    scenario: Scenario
+    maxsize: int = 1 << 16
+    hits: int = 0
+    misses: int = 0
+    _entries: OrderedDict = field(default_factory=OrderedDict, repr=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def run(self, action: Action, agent: Agent, obs: MaskObs) -> List[MaskObs]:
+        key = (obs, action.name, None if agent is None else agent.name)
+        out = self._entries.get(key)
+        if out is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return out
+
+        self.misses += 1
+        out = self._entries[key] = action.step(obs, *self.scenario.get_statements(action, agent))
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return out
 
 
 @dataclass(slots=True)
@@ -57,6 +118,9 @@ class Query:
     termination: int
 
     states: List[State] = None
+    engine: str = 'paths'
+    # frontier of the paths engine above which models are spilled to disk, unbounded in memory if None
+    budget: FrontierBudget = None
 
     @classmethod
     def from_ui(cls, scenario, termination, states, data: dict) -> List[ActionQuery | FormulaQuery | AgentQuery]:
@@ -72,46 +136,195 @@ class Query:
             raise ParsingException('Failed to parse query.')
         return out
 
-    def run(self) -> List[QuasiModel]:
-
-        cur_obs: List[Obs] = self.scenario.get_first_obs(states=self.states)
+    def simulation_key(self) -> tuple:
+        """queries with the same simulation key share their models"""
+        return id(self.scenario), self.termination, tuple(_state.name for _state in self.states or []), self.engine
+
+    def key(self) -> tuple:
+        """queries with the same key have the same answer"""
+        return self.simulation_key(),
+
+    def fluents(self) -> Optional[Set[str]]:
+        """fluents the answer reads besides realizability, None if it can depend on all of them"""
+        return set()
+
+    def decompose(self, components: List[Component]) -> Optional[List[Query]]:
+        """Queries on independent components of the scenario answering this one with compose, the first query
+        answers it unless compose says otherwise and the rest only need their component to be realizable.
+        None if the answer needs the whole scenario."""
+        return None
+
+    def compose(self, answers: List[bool]) -> bool:
+        return answers[0]
+
+    def _on(self, component: Component) -> Query:
+        _scenario, states, _ = component
+        return replace(self, scenario=_scenario, states=states)
+
+    def _realizable_on(self, component: Component) -> RealizabilityQuery:
+        _scenario, states, _ = component
+        return RealizabilityQuery(scenario=_scenario, termination=self.termination, states=states,
+                                  engine=self.engine, budget=self.budget)
+
+    def evaluate(self, models: List[QuasiModel]):
+        return models
+
+    def evaluate_graph(self, graph: StateGraph | FrontierGraph):
+        return graph
+
+    def evaluate_stream(self, models: Iterator[QuasiModel]):
+        return list(models)
+
+    def simulate(
+            self, transitions: TransitionCache = None, models: List[QuasiModel] = None, start: int = 0
+    ) -> List[QuasiModel] | StateGraph | FrontierGraph | Iterator[QuasiModel]:
+        """Models of the scenario in the form the engine of the query keeps them.
+
+        Given models continue from the timepoint with index start, graph engines can only start from the first one.
+        """
+        if self.engine == 'paths':
+            return Query.run(self, transitions, models, start)
+        if self.engine == 'dfs':
+            return self.models(transitions, models, start)
+        first_obs = None if models is None else self._first_obs(models, start)
+        if self.engine == 'graph':
+            return StateGraph.build(self.scenario, self.termination, self.states, transitions=transitions,
+                                    first_obs=first_obs)
+        if self.engine == 'numpy':
+            return FrontierGraph.build(self.scenario, self.termination, self.states, first_obs=first_obs)
+        raise LogicException(f"Unknown simulation engine '{self.engine}', expected one of {', '.join(ENGINES)}.")
+
+    def _first_obs(self, models: List[QuasiModel], start: int) -> List[MaskObs]:
+        if start != 0:
+            raise LogicException(f"The '{self.engine}' engine can only start from the first timepoint.")
+        return [model.get_last_timepoint().obs for model in models]
+
+    def initial_models(self) -> List[QuasiModel]:
+        return list(self.iter_initial_models())
+
+    def iter_initial_models(self) -> Iterator[QuasiModel]:
+        """initial models generated one at a time from the first OBS"""
         first_t: int = self.scenario.get_first_t()
-        cur_models: List[QuasiModel] = [
-            QuasiModel(
-                path=[TimePoint(
-                    t=first_t,
-                    obs=obs
-                )]) for obs in cur_obs
-        ]
+        for obs in self.scenario.first_obs(states=self.states):
+            yield QuasiModel.from_path([TimePoint(t=first_t, obs=obs)])
+
+    def timepoints(self) -> List[TimePoint]:
+        """timepoints simulated before termination"""
+        return [timepoint for t, timepoint in self.scenario.timepoints.items() if t <= self.termination]
+
+    def combine(self, answers: List[bool]) -> bool:
+        """answer of the query from the answers on parts of the models with at least one model each"""
+        return all(answers)
+
+    def decides(self, answer: bool) -> bool:
+        """whether an answer on a part of the models is the answer on all of them"""
+        return answer != self.combine([])
+
+    def answer(self, simulation: List[QuasiModel] | StateGraph | FrontierGraph | Iterator[QuasiModel]):
+        if isinstance(simulation, (StateGraph, FrontierGraph)):
+            return self.evaluate_graph(simulation)
+        if isinstance(simulation, Iterator):
+            return self.evaluate_stream(simulation)
+        return self.evaluate(simulation)
+
+    def models(
+            self, transitions: TransitionCache = None, models: List[QuasiModel] = None, start: int = 0
+    ) -> Iterator[QuasiModel]:
+        """Same models as run, depth first and one at a time, keeping only the siblings along the current path.
+
+        Raises LogicException once exhausted if no model was realizable. A consumer that stops early
+        never sees the errors of the branches it did not explore.
+        """
+        transitions = TransitionCache(self.scenario) if transitions is None else transitions
+        vocabulary = Vocabulary.from_states(self.states)
+        manager = bdd.manager_for(vocabulary)
+        timepoints: List[TimePoint] = self.timepoints()
+        accepted = [timepoint.obs.accepts(manager) if timepoint.is_obs() else None for timepoint in timepoints]
+
+        # every entry iterates over (model, index of the next timepoint) siblings
+        stack = [((model, start) for model in (self.iter_initial_models() if models is None else models))]
+        realizable = False
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
 
-        for t, timepoint in self.scenario.timepoints.items():
-            if t > self.termination:
-                break
+            model, k = item
+            if k == len(timepoints):
+                realizable = True
+                yield model
+                continue
 
+            timepoint = timepoints[k]
+            obs = model.get_last_timepoint().obs
+            if accepted[k] is not None and not accepted[k](obs.value):
+                continue
+            if not timepoint.is_acs():
+                stack.append(iter([(model, k + 1)]))
+                continue
+
+            action, agent = timepoint.acs
+            _res: List[MaskObs] = transitions.run(action, agent, obs)
+            if _res:
+                stack.append(iter([
+                    (model.extend(TimePoint(t=timepoint.t + 1, obs=_obs, acs=(action, agent))), k + 1)
+                    for _obs in _res
+                ]))
+            else:
+                stack.append(iter([(model, k + 1)]))
+
+        if not realizable:
+            raise LogicException(NOT_REALIZABLE)
+
+    def _frontier(self, vocabulary: Vocabulary, t: int) -> List[QuasiModel] | SpilledModels:
+        return [] if self.budget is None else SpilledModels(self.budget, self.scenario, vocabulary, t)
+
+    def run(
+            self, transitions: TransitionCache = None, models: List[QuasiModel] = None, start: int = 0,
+            stop: int = None
+    ) -> List[QuasiModel] | SpilledModels:
+        """Models of the scenario, or of the given models simulated from the timepoint with index start to stop.
+
+        With a budget every frontier above budget.memory models is spilled to disk, and one above budget.total
+        raises BudgetException.
+        """
+        transitions = TransitionCache(self.scenario) if transitions is None else transitions
+        vocabulary = Vocabulary.from_states(self.states)
+        manager = bdd.manager_for(vocabulary)
+        if models is None:
+            # with a budget the initial models are spilled like any frontier
+            cur_models = self._frontier(vocabulary, self.scenario.get_first_t())
+            cur_models.extend(self.iter_initial_models())
+        else:
+            cur_models = models
+        collected = stats.current
+
+        for timepoint in self.timepoints()[start:stop]:
+            t = timepoint.t
             if timepoint.is_obs():
-                possible_obs: List[Obs] = timepoint.obs.get_all_possibilities()
-                cur_models = list(
-                    filter(
-                        lambda model: any(
-                            list(
-                                map(lambda _other: _other.is_superset(model.get_last_timepoint().obs), possible_obs))),
-                        cur_models)
-                )
+                accepts = timepoint.obs.accepts(manager)
+                before = len(cur_models)
+                kept = self._frontier(vocabulary, t)
+                kept.extend(model for model in cur_models if accepts(model.get_last_timepoint().obs.value))
+                cur_models = kept
+                if collected is not None:
+                    collected.formula_evaluations += before
+                    collected.pruned.append((t, before - len(cur_models)))
                 if len(cur_models) == 0:
-                    raise LogicException('This scenario is not realizable')
+                    raise LogicException(NOT_REALIZABLE)
 
             if not timepoint.is_acs():
+                if collected is not None:
+                    collected.frontier.append((t, len(cur_models)))
                 continue
 
             action, agent = timepoint.acs
 
-            statements: List[Statement] = get_statements(
-                action, agent, self.scenario.statements)
-
-            new_models = []
+            new_models = self._frontier(vocabulary, t + 1)
             for model in cur_models:
                 tp = model.get_last_timepoint()
-                _res: List[Obs] = action.run(tp.obs, statements)
+                _res: List[MaskObs] = transitions.run(action, agent, tp.obs)
                 if _res:
                     for _obs in _res:
                         # create
@@ -120,12 +333,13 @@ class Query:
                             obs=_obs,
                             acs=(action, agent)
                         )
-                        new_path = copy.deepcopy(model.path)
-                        new_path.append(new_tp)
-                        new_models.append(QuasiModel(new_path))
+                        new_models.append(model.extend(new_tp))
                 else:
                     new_models.append(model)
 
+            if collected is not None:
+                collected.branching.append((t, len(new_models) / len(cur_models) if cur_models else 0.0))
+                collected.frontier.append((t, len(new_models)))
             cur_models = new_models
         return cur_models
 
@@ -149,23 +363,48 @@ class ActionQuery(Query):
             raise ParsingException('Failed to parse action query.')
         return out
 
+    def key(self) -> tuple:
+        return self.simulation_key(), 'action', self.action.name, self.time
+
     def run(self) -> bool:
-        models = super(ActionQuery, self).run()
+        return self.answer(self.simulate())
+
+    def combine(self, answers: List[bool]) -> bool:
+        return any(answers)
+
+    def decides(self, answer: bool) -> bool:
+        # any part with a model shows the scenario is realizable
+        return True
+
+    def decompose(self, components: List[Component]) -> Optional[List[Query]]:
+        return [self._on(components[0])] + [self._realizable_on(component) for component in components[1:]]
+
+    def is_performed(self) -> bool:
         item = self.scenario.timepoints.get(self.time, None)
-        is_performed = item is not None and item.is_acs() and self.time < self.termination and \
-                       item.acs[0] == self.action
+        return item is not None and item.is_acs() and self.time < self.termination and \
+            item.acs[0] == self.action
+
+    def evaluate(self, models: List[QuasiModel]) -> bool:
         if len(models) != 0:
-            if is_performed:
+            if self.is_performed():
                 return True
         return False
 
+    def evaluate_graph(self, graph: StateGraph | FrontierGraph) -> bool:
+        return graph.is_realizable() and self.is_performed()
+
+    def evaluate_stream(self, models: Iterator[QuasiModel]) -> bool:
+        # one realizable model is enough, the stream raises if there is none
+        next(models)
+        return self.is_performed()
+
 
 @dataclass(slots=True)
 class FormulaQuery(Query):
     formula: Formula = None
     time: int = None
     mode: str = None  # 'necessary', 'possibly'
-    possibilities: List[Obs] = None
+    possibilities: Possibilities = None
 
     def __post_init__(self):
         self.mode = self.mode.lower()
@@ -190,10 +429,27 @@ class FormulaQuery(Query):
             raise ParsingException('Failed to parse fluent query.')
         return out
 
+    def key(self) -> tuple:
+        return self.simulation_key(), 'fluent', repr(self.formula.structure), self.time, self.mode
+
+    def fluents(self) -> Optional[Set[str]]:
+        return set(self.formula.extract_states()) if self.formula.structure else set()
+
+    def decompose(self, components: List[Component]) -> Optional[List[Query]]:
+        fluents = self.fluents()
+        # the formula is in one component as its fluents link them, a formula without fluents in any
+        k = next(i for i, (_, _, names) in enumerate(components) if fluents <= names)
+        return [self._on(components[k])] + [
+            self._realizable_on(component) for i, component in enumerate(components) if i != k
+        ]
+
     def run(self) -> bool:
-        models = super(FormulaQuery, self).run()
+        return self.answer(self.simulate())
+
+    def evaluate(self, models: List[QuasiModel]) -> bool:
         if len(models) != 0:
-            condition_models = [model.condition_holds(self.possibilities, self.time) for model in models]
+            possibilities = self.possibilities.encode(Vocabulary.from_states(self.states))
+            condition_models = [model.condition_holds(possibilities, self.time) for model in models]
             if self.mode == 'necessary':
                 if all(condition_models):
                     return True
@@ -202,6 +458,39 @@ class FormulaQuery(Query):
                 return True
             return False
 
+    def evaluate_graph(self, graph: StateGraph | FrontierGraph) -> bool:
+        condition_states = graph.condition_at(self.formula, self.time)
+        if self.mode == 'necessary':
+            return len(condition_states) != 0 and bool(all(condition_states))
+        return bool(any(condition_states))
+
+    def combine(self, answers: List[bool]) -> bool:
+        return any(answers) if self.mode == 'possibly' else all(answers)
+
+    def evaluate_stream(self, models: Iterator[QuasiModel]) -> bool:
+        possibilities = self.possibilities.encode(Vocabulary.from_states(self.states))
+        for model in models:
+            holds = model.condition_holds(possibilities, self.time)
+            if holds and self.mode == 'possibly':
+                return True
+            if not holds and self.mode == 'necessary':
+                return False
+        return self.mode == 'necessary'
+
+
+@dataclass(slots=True)
+class RealizabilityQuery(Query):
+    """whether the scenario has a model, simulating a scenario without one raises"""
+
+    def evaluate(self, models: List[QuasiModel]) -> bool:
+        return len(models) != 0
+
+    def evaluate_graph(self, graph: StateGraph | FrontierGraph) -> bool:
+        return graph.is_realizable()
+
+    def evaluate_stream(self, models: Iterator[QuasiModel]) -> bool:
+        return next(models, None) is not None
+
 
 def flatten_list(_list: List[List[Obs]]) -> List[Obs]:
     res = []
@@ -235,8 +524,41 @@ class AgentQuery(Query):
             raise ParsingException('Failed to parse agent query.')
         return out
 
+    def simulation_key(self) -> tuple:
+        key = Query.simulation_key(self)
+        return key + ('agents',) if self.engine in GRAPH_ENGINES else key
+
+    def key(self) -> tuple:
+        return self.simulation_key(), 'agent', self.agent.name
+
+    def fluents(self) -> Optional[Set[str]]:
+        # an agent is active if any fluent changes
+        return None
+
+    def decompose(self, components: List[Component]) -> Optional[List[Query]]:
+        # in every combination of models of the components some step changes a fluent of the agent
+        # exactly when it does in every model of one component
+        return [self._on(component) for component in components]
+
+    def compose(self, answers: List[bool]) -> bool:
+        return any(answers)
+
+    def simulate(
+            self, transitions: TransitionCache = None, models: List[QuasiModel] = None, start: int = 0
+    ) -> List[QuasiModel] | StateGraph | FrontierGraph | Iterator[QuasiModel]:
+        first_obs = None if models is None or self.engine not in GRAPH_ENGINES else self._first_obs(models, start)
+        if self.engine == 'graph':
+            return StateGraph.build(self.scenario, self.termination, self.states, track_agents=True,
+                                    transitions=transitions, first_obs=first_obs)
+        if self.engine == 'numpy':
+            return FrontierGraph.build(self.scenario, self.termination, self.states, track_agents=True,
+                                       first_obs=first_obs)
+        return Query.simulate(self, transitions, models, start)
+
     def run(self) -> bool:
-        models = super(AgentQuery, self).run()
+        return self.answer(self.simulate())
+
+    def evaluate(self, models: List[QuasiModel]) -> bool:
         is_active = True
         if len(models) != 0:
             for model in models:
@@ -248,3 +570,157 @@ class AgentQuery(Query):
             return True
 
         return False
+
+    def evaluate_graph(self, graph: StateGraph | FrontierGraph) -> bool:
+        return graph.is_agent_active(self.agent)
+
+    def evaluate_stream(self, models: Iterator[QuasiModel]) -> bool:
+        return all(model.is_agent_active(self.agent) for model in models)
+
+
+def run_batch(
+        queries: List[Query], engine: str = None, models: List[QuasiModel] = None, start: int = 0,
+        slicing: bool = True, decomposition: bool = True
+) -> List[bool | Exception]:
+    """Answers all queries, simulating every scenario/termination pair once and evaluating identical queries once.
+
+    Results are in the order of queries, a query that failed gets its exception instead.
+    A given engine overrides the engine of every query. Queries of a scenario share its transitions.
+    Given models are simulated from the timepoint with index start instead of the initial models.
+    With slicing, queries starting from the initial models simulate only the cone of influence of their fluents,
+    with decomposition every independent component of the fluents is simulated on its own.
+    """
+    if engine is not None:
+        queries = [replace(query, engine=engine) for query in queries]
+    if models is None:
+        if slicing:
+            queries = _sliced(queries)
+        if decomposition:
+            return _decomposed(queries)
+    return _run_batch(queries, models, start)
+
+
+def _run_batch(queries: List[Query], models: List[QuasiModel] = None, start: int = 0) -> List[bool | Exception]:
+    transitions: Dict[int, TransitionCache] = {}
+    simulations: Dict[tuple, List[QuasiModel] | StateGraph | FrontierGraph | Iterator[QuasiModel] | Exception] = {}
+    answers: Dict[tuple, bool | Exception] = {}
+    out = []
+    for query in queries:
+        key = query.key()
+        if key not in answers:
+            simulation_key = query.simulation_key()
+            if simulation_key not in simulations:
+                cache = transitions.setdefault(id(query.scenario), TransitionCache(query.scenario))
+                try:
+                    with stats.phase('simulate'):
+                        simulations[simulation_key] = query.simulate(cache, models, start)
+                except Exception as e:
+                    simulations[simulation_key] = e
+            simulation = simulations[simulation_key]
+            if isinstance(simulation, Iterator):
+                # a stream of models is consumed by the query reading it
+                del simulations[simulation_key]
+            if isinstance(simulation, Exception):
+                answers[key] = simulation
+            else:
+                try:
+                    # streams are simulated while they are read, that time is spent evaluating
+                    with stats.phase('evaluate'):
+                        answers[key] = query.answer(simulation)
+                except Exception as e:
+                    answers[key] = e
+        out.append(answers[key])
+    if stats.current is not None:
+        for cache in transitions.values():
+            stats.current.cache_hits += cache.hits
+            stats.current.cache_misses += cache.misses
+    return out
+
+
+def _sliced(queries: List[Query]) -> List[Query]:
+    """Queries on the scenarios sliced to the cone of influence of the fluents of all queries sharing a simulation.
+
+    Queries sharing a simulation keep sharing one, queries whose cone has every state are left as they are.
+    """
+    groups: Dict[tuple, List[int]] = {}
+    for i, query in enumerate(queries):
+        groups.setdefault(query.simulation_key(), []).append(i)
+    out = list(queries)
+    for indices in groups.values():
+        try:
+            sliced = _sliced_group([queries[i] for i in indices])
+        except Exception:
+            # the whole scenario is simulated, which reports the error per query if it has one
+            continue
+        for i, query in zip(indices, sliced):
+            out[i] = query
+    return out
+
+
+def _sliced_group(queries: List[Query]) -> List[Query]:
+    fluents = set()
+    for query in queries:
+        query_fluents = query.fluents()
+        if query_fluents is None:
+            return queries
+        fluents |= query_fluents
+    first = queries[0]
+    states = first.states or []
+    cone = first.scenario.cone_of_influence(fluents, states)
+    if cone is None or len(cone) >= len(states):
+        return queries
+    scenario = first.scenario.sliced(cone)
+    sliced_states = [_state for _state in states if _state.name in cone]
+    return [replace(query, scenario=scenario, states=sliced_states) for query in queries]
+
+
+def _decomposed(queries: List[Query]) -> List[bool | Exception]:
+    """Answers of the queries from the independent components of their scenarios, simulated one by one.
+
+    A query with a part failing for another reason than having no model is answered on the whole scenario,
+    which raises the same error as before at the same timepoint.
+    """
+    groups: Dict[tuple, List[int]] = {}
+    for i, query in enumerate(queries):
+        groups.setdefault(query.simulation_key(), []).append(i)
+    parts: List[Query] = []
+    spans: Dict[int, range] = {}
+    for indices in groups.values():
+        first = queries[indices[0]]
+        linked = [fluents for fluents in (queries[i].fluents() for i in indices) if fluents]
+        try:
+            names = first.scenario.components(linked, first.states or [])
+            if names is None or len(names) < 2:
+                continue
+            components = [
+                (first.scenario.restricted(component),
+                 [_state for _state in first.states if _state.name in component], component)
+                for component in names
+            ]
+        except Exception:
+            # the whole scenario is simulated, which reports the error per query if it has one
+            continue
+        for i in indices:
+            split = queries[i].decompose(components)
+            if split is not None:
+                spans[i] = range(len(parts), len(parts) + len(split))
+                parts += split
+
+    answers = _run_batch(parts)
+    out: List[bool | Exception] = [None] * len(queries)
+    whole = []
+    for i, query in enumerate(queries):
+        span = spans.get(i)
+        if span is not None:
+            part_answers = [answers[j] for j in span]
+            errors = [answer for answer in part_answers if isinstance(answer, Exception)]
+            if not errors:
+                out[i] = query.compose(part_answers)
+                continue
+            if all(type(error) is LogicException and error.args == (NOT_REALIZABLE,) for error in errors):
+                out[i] = errors[0]
+                continue
+        whole.append(i)
+    for i, answer in zip(whole, _run_batch([queries[i] for i in whole])):
+        out[i] = answer
+    return out
@@ -1,19 +1,25 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
 from sortedcontainers import SortedDict
 
 from . import LogicException, ParsingException
-from . import Statement, TimePoint, Obs, State
-from .formula import _get_all_possibilities
+from . import Agent, Statement, EffectStatement, ReleaseStatement, TimePoint, Obs, State, Vocabulary, MaskObs, Formula
+from . import bdd
+from .action import Action
+from .formula import tree_fluents
 
 
 @dataclass(slots=True)
 class Scenario:
     statements: List[Statement]
     timepoints: SortedDict[int, TimePoint] = field(default_factory=SortedDict)
+    # statements of every action, then the split statements of every (action, agent) pair, built on first use
+    _by_action: Dict[Action, List[Statement]] = field(default=None, init=False, repr=False, compare=False)
+    _index: Dict[Tuple[Action, Agent], Tuple[Tuple[EffectStatement, ...], Tuple[ReleaseStatement, ...]]] = \
+        field(default_factory=dict, init=False, repr=False, compare=False)
 
     @classmethod
     def from_timepoints(cls, timepoints: List[TimePoint], statements: List[Statement]):
@@ -38,25 +44,167 @@ class Scenario:
     def is_realisable(self) -> bool:
         return True
 
-    def get_first_obs(self, states: List[State]) -> List[Obs]:
+    def get_first_obs(self, states: List[State]) -> List[MaskObs]:
+        return list(self.first_obs(states))
+
+    def first_obs(self, states: List[State]) -> Iterator[MaskObs]:
+        """initial states, generated one at a time, see first_values"""
+        vocabulary = Vocabulary.from_states(states)
+        for value in self.first_values(vocabulary):
+            yield MaskObs(vocabulary=vocabulary, known=vocabulary.full, value=value)
+
+    def first_values(self, vocabulary: Vocabulary) -> Iterator[int]:
+        """Values of the initial states over the vocabulary, generated lazily from the first OBS.
+
+        Only the satisfying assignments are walked: a fluent the OBS forces has one branch left, so only
+        the fluents it leaves open are branched over and memory does not grow with the number of states.
+        """
         k = next(iter(self.timepoints.keys()), None)
         if k is None:
             raise LogicException('ACS or OBS must be provided')
 
-        all_states: List[Obs] = _get_all_possibilities(list(map(lambda _state: _state.name, states)))
         if not self.timepoints[k].is_obs():
-            return all_states
-        possible_obs: List[Obs] = self.timepoints[k].obs.get_all_possibilities()
-        
-        states = list(
-            filter(
-                lambda obs: any(
-                    list(
-                        map(lambda _other: _other.is_superset(obs), 
-                            possible_obs))),
-                all_states)
+            return iter(range(vocabulary.full, -1, -1))
+        return self.timepoints[k].obs.accepts(bdd.manager_for(vocabulary)).assignments(vocabulary.full)
+
+    def get_statements(
+            self, action: Action, agent: Agent
+    ) -> Tuple[Tuple[EffectStatement, ...], Tuple[ReleaseStatement, ...]]:
+        """effect and release statements of the action performed by the agent.
+
+        Statements without an agent apply to every agent. The index assumes statements are not changed afterwards.
+        """
+        key = (action, agent)
+        out = self._index.get(key)
+        if out is None:
+            if self._by_action is None:
+                self._by_action = {}
+                for _statement in self.statements:
+                    self._by_action.setdefault(_statement.action, []).append(_statement)
+            statements = [
+                _statement for _statement in self._by_action.get(action, [])
+                if _statement.agent is None or _statement.agent.name is None or _statement.agent == agent
+            ]
+            out = self._index[key] = (
+                tuple(_statement for _statement in statements if isinstance(_statement, EffectStatement)),
+                tuple(_statement for _statement in statements if isinstance(_statement, ReleaseStatement))
+            )
+        return out
+
+    def cone_of_influence(self, fluents: Iterable[str], states: List[State]) -> Optional[FrozenSet[str]]:
+        """Fluents that can influence the given fluents or whether the scenario is realizable.
+
+        Starts from the given fluents, the fluents of every OBS and those of statements changing a fluent another
+        statement of the same action changes, as together they can block the action or make it disjoint.
+        Then adds the precondition and effect fluents of every statement changing a fluent of the cone until
+        nothing changes, so statements outside the cone never change a fluent in it. None if a formula mentions
+        a fluent outside the states or an effect can never hold, which blocks its action whatever the cone.
+        """
+        fluents_of = [_statement_fluents(_statement) for _statement in self.statements]
+        mentioned = {name for changed, read in fluents_of for name in changed | read}
+        cone = set(fluents)
+        for timepoint in self.timepoints.values():
+            if timepoint.is_obs():
+                cone |= _fluents(timepoint.obs.formula)
+        if not (mentioned | cone) <= {_state.name for _state in states} or any(
+                isinstance(_statement, EffectStatement) and len(_statement.postcondition) == 0
+                for _statement in self.statements
+        ):
+            return None
+
+        by_action: Dict[Action, List[int]] = {}
+        for i, _statement in enumerate(self.statements):
+            by_action.setdefault(_statement.action, []).append(i)
+        for indices in by_action.values():
+            for i in indices:
+                if any(j != i and fluents_of[i][0] & fluents_of[j][0] for j in indices):
+                    cone |= fluents_of[i][0] | fluents_of[i][1]
+
+        grown = True
+        while grown:
+            grown = False
+            for changed, read in fluents_of:
+                if changed & cone and not (changed | read) <= cone:
+                    cone |= changed | read
+                    grown = True
+        return frozenset(cone)
+
+    def sliced(self, fluents: FrozenSet[str]) -> Scenario:
+        """scenario with only the statements changing the fluents, which must be a cone of influence"""
+        return Scenario(
+            statements=[
+                _statement for _statement in self.statements if _statement_fluents(_statement)[0] & fluents
+            ],
+            timepoints=self.timepoints
+        )
+
+    def components(self, linked: Iterable[Iterable[str]], states: List[State]) -> Optional[List[FrozenSet[str]]]:
+        """Fluents of the states split into independent components, in the order of the states.
+
+        Fluents are in one component when a statement, a conjunct of an OBS or one of the linked groups mentions
+        them together, so no action couples two components. Every fluent of an action is in one component when two
+        of its statements change the same fluent, as contradicting effects block all of them. None in the same cases
+        as cone_of_influence.
+        """
+        names = [_state.name for _state in states]
+        fluents_of = [_statement_fluents(_statement) for _statement in self.statements]
+        groups = [changed | read for changed, read in fluents_of]
+        by_action: Dict[Action, List[int]] = {}
+        for i, _statement in enumerate(self.statements):
+            by_action.setdefault(_statement.action, []).append(i)
+        for indices in by_action.values():
+            if any(fluents_of[i][0] & fluents_of[j][0] for i in indices for j in indices if i < j):
+                groups.append(set().union(*(groups[i] for i in indices)))
+        groups += [set(group) for group in linked]
+        for timepoint in self.timepoints.values():
+            if timepoint.is_obs() and timepoint.obs.formula is not None and timepoint.obs.formula.structure:
+                groups += [set(tree_fluents(conjunct)) for conjunct in _conjuncts(timepoint.obs.formula.tree)]
+        if not set().union(*groups) <= set(names) or any(
+                isinstance(_statement, EffectStatement) and len(_statement.postcondition) == 0
+                for _statement in self.statements
+        ):
+            return None
+
+        parent = {name: name for name in names}
+
+        def find(name: str) -> str:
+            while parent[name] != name:
+                parent[name] = name = parent[parent[name]]
+            return name
+
+        for group in groups:
+            roots = [find(name) for name in group]
+            for root in roots[1:]:
+                parent[root] = roots[0]
+        out: Dict[str, Set[str]] = {}
+        for name in names:
+            out.setdefault(find(name), set()).add(name)
+        return [frozenset(component) for component in out.values()]
+
+    def restricted(self, fluents: FrozenSet[str]) -> Scenario:
+        """scenario of one component, with its statements and the conjuncts of every OBS mentioning its fluents"""
+        timepoints = SortedDict()
+        for t, timepoint in self.timepoints.items():
+            obs = None
+            if timepoint.is_obs() and timepoint.obs.formula is not None and timepoint.obs.formula.structure:
+                conjuncts = [
+                    _structure(conjunct) for conjunct in _conjuncts(timepoint.obs.formula.tree)
+                    if set(tree_fluents(conjunct)) <= fluents
+                ]
+                if conjuncts:
+                    # a flat structure is read from the left, as nested conjunctions of the conjuncts
+                    structure = [conjuncts[0]]
+                    for conjunct in conjuncts[1:]:
+                        structure += ['and', conjunct]
+                    obs = Obs(formula=Formula(structure=structure))
+            timepoints[t] = TimePoint(t=t, acs=timepoint.acs, obs=obs)
+        return Scenario(
+            statements=[
+                _statement for _statement in self.statements
+                if set().union(*_statement_fluents(_statement)) & fluents
+            ],
+            timepoints=timepoints
         )
-        return states
 
     def get_first_t(self):
         k = next(iter(self.timepoints.values()), None)
@@ -67,3 +215,35 @@ class Scenario:
 
     def __len__(self):
         return len(self.timepoints)
+
+
+def _fluents(formula: Formula) -> Set[str]:
+    return set(formula.extract_states()) if formula is not None and formula.structure else set()
+
+
+def _statement_fluents(_statement: Statement) -> Tuple[Set[str], Set[str]]:
+    """fluents the statement changes and fluents it reads"""
+    if isinstance(_statement, ReleaseStatement):
+        return {_statement.postcondition.name}, _fluents(_statement.precondition)
+    return _fluents(_statement.formula), _fluents(_statement.precondition)
+
+
+def _conjuncts(tree: tuple) -> List[tuple]:
+    """conjuncts of the tree from the left, iteratively as long OBS give deep trees"""
+    out, stack = [], [tree]
+    while stack:
+        node = stack.pop()
+        if node[0] == 'and':
+            stack += (node[2], node[1])
+        else:
+            out.append(node)
+    return out
+
+
+def _structure(tree: tuple):
+    """formula structure read back as the tree"""
+    if tree[0] in ('fluent', 'const'):
+        return tree[1]
+    if tree[0] == 'not':
+        return ['not', _structure(tree[1])]
+    return [_structure(tree[1]), tree[0], _structure(tree[2])]
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from typing import IO, Iterable, Iterator, List, Tuple
+
+from . import BudgetException, LogicException, Scenario, Vocabulary, MaskObs, TimePoint
+from . import query as q
+
+
+@dataclass(frozen=True, slots=True)
+class FrontierBudget:
+    """Models of a frontier of the paths engine kept in memory, and in total with the ones spilled to disk"""
+    memory: int = 1 << 18
+    total: int = 1 << 24
+    # directory of the spill files, the system temporary directory by default
+    directory: str = None
+
+    def __post_init__(self):
+        if not 0 < self.memory <= self.total:
+            raise LogicException('Frontier budget must keep at least one model in memory and no more than in total.')
+
+
+class SpilledModels:
+    """Models of a frontier, kept in memory up to the budget and pickled to a temporary file in chunks above it.
+
+    Only the timepoints (t, known, value) of every model are written, the ACS of a timepoint after the first
+    is the ACS of the scenario just before it. Iterating streams the spilled chunks back, then the models in memory.
+    """
+    __slots__ = ('budget', 'scenario', 'vocabulary', 't', '_models', '_file', '_offsets', '_spilled')
+
+    def __init__(self, budget: FrontierBudget, scenario: Scenario, vocabulary: Vocabulary, t: int):
+        self.budget = budget
+        self.scenario = scenario
+        self.vocabulary = vocabulary
+        self.t = t
+        self._models = []
+        self._file: IO[bytes] | None = None
+        # start of every chunk in the file, reads seek there so iterations do not disturb each other
+        self._offsets: List[int] = []
+        self._spilled = 0
+
+    def append(self, model: q.QuasiModel) -> None:
+        self._models.append(model)
+        if len(self._models) >= self.budget.memory:
+            self._spill()
+
+    def extend(self, models: Iterable[q.QuasiModel]) -> None:
+        for model in models:
+            self.append(model)
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._models)
+
+    def __iter__(self) -> Iterator[q.QuasiModel]:
+        for offset in self._offsets:
+            self._file.seek(offset)
+            for packed in pickle.load(self._file):
+                yield self._unpack(packed)
+        yield from self._models
+
+    def _spill(self) -> None:
+        if len(self) > self.budget.total:
+            raise BudgetException(
+                f'Frontier of {len(self)} models at time {self.t} exceeds the budget of {self.budget.total} models.'
+            )
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='krr-frontier-', dir=self.budget.directory)
+        self._file.seek(0, os.SEEK_END)
+        self._offsets.append(self._file.tell())
+        pickle.dump([self._pack(model) for model in self._models], self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spilled += len(self._models)
+        self._models = []
+
+    @staticmethod
+    def _pack(model: q.QuasiModel) -> Tuple[int, ...]:
+        out = []
+        for timepoint in model.path:
+            out += (timepoint.t, timepoint.obs.known, timepoint.obs.value)
+        return tuple(out)
+
+    def _unpack(self, packed: Tuple[int, ...]) -> q.QuasiModel:
+        path = []
+        for i in range(0, len(packed), 3):
+            t, known, value = packed[i:i + 3]
+            acs = self.scenario.timepoints[t - 1].acs if i else None
+            path.append(TimePoint(t=t, obs=MaskObs(vocabulary=self.vocabulary, known=known, value=value), acs=acs))
+        return q.QuasiModel.from_path(path)
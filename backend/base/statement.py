@@ -35,7 +35,7 @@ class Statement(ABC):
 @dataclass(slots=True)
 class EffectStatement(Statement):
     formula: formula.Formula
-    postcondition: List[timepoint.Obs] = None
+    postcondition: formula.Possibilities = None
 
     def __post_init__(self):
         self.postcondition = self.formula.get_all_possibilities()
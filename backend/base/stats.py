@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass(slots=True)
+class Stats:
+    """Counters of the engine collected while active, see collect.
+
+    Frontier, branching and pruning are recorded by the paths engine, per timepoint t of the scenario.
+    """
+    # models after every timepoint
+    frontier: List[Tuple[int, int]] = field(default_factory=list)
+    # models after every ACS per model before it
+    branching: List[Tuple[int, float]] = field(default_factory=list)
+    # models removed by every OBS
+    pruned: List[Tuple[int, int]] = field(default_factory=list)
+    formula_evaluations: int = 0
+    possibilities: int = 0
+    # Action.step calls and the states they produced
+    transitions: int = 0
+    outcomes: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # seconds spent per phase, 'simulate' and 'evaluate'
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+    def merge(self, other: Stats) -> Stats:
+        self.frontier += other.frontier
+        self.branching += other.branching
+        self.pruned += other.pruned
+        self.formula_evaluations += other.formula_evaluations
+        self.possibilities += other.possibilities
+        self.transitions += other.transitions
+        self.outcomes += other.outcomes
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        for phase, seconds in other.seconds.items():
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        return self
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+# stats being collected, instrumented code checks it once per call so nothing is counted while it is None
+current: Optional[Stats] = None
+
+
+@contextmanager
+def collect(stats: Stats = None) -> Iterator[Stats]:
+    """collects the counters of the engine into the stats (new ones by default) inside the block"""
+    global current
+    previous, current = current, Stats() if stats is None else stats
+    try:
+        yield current
+    finally:
+        current = previous
+
+
+@contextmanager
+def _timed(stats: Stats, phase: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.seconds[phase] = stats.seconds.get(phase, 0.0) + time.perf_counter() - start
+
+
+def phase(name: str):
+    """adds the time spent inside the block to the phase, does nothing if no stats are collected"""
+    return nullcontext() if current is None else _timed(current, name)
@@ -0,0 +1,86 @@
+import unittest
+
+from backend.base import Formula, State, Obs, Vocabulary, Action, Agent, EffectStatement
+from backend.base import bdd
+
+
+class BDDTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.vocabulary = Vocabulary.from_states([State('a'), State('b'), State('c')])
+        self.manager = bdd.BDD(self.vocabulary)
+
+    def test_given_equivalent_formulas_when_to_bdd_then_same_node(self):
+        # given
+        first = Formula(['a', 'implies', 'b'])
+        second = Formula([['not', 'a'], 'or', 'b'])
+        # then
+        self.assertEqual(first.to_bdd(self.manager), second.to_bdd(self.manager))
+
+    def test_given_tautology_when_to_bdd_then_true(self):
+        # given
+        formula = Formula(['a', 'or', ['not', 'a']])
+        # then
+        self.assertEqual(bdd.TRUE, formula.to_bdd(self.manager))
+
+    def test_given_formula_when_assignments_then_same_as_possibilities(self):
+        # given
+        formula = Formula(['a', 'and', ['b', 'if and only if', 'c']])
+        node = formula.to_bdd(self.manager)
+        # when
+        assignments = list(self.manager.assignments(node, self.vocabulary.full))
+        # then
+        self.assertCountEqual([0b111, 0b001], assignments)
+        self.assertEqual(2, self.manager.count(node, self.vocabulary.full))
+
+    def test_given_formula_when_evaluate_then_same_as_bool(self):
+        # given
+        formula = Formula([['a', 'or', 'b'], 'implies', ['not', 'c']])
+        node = formula.to_bdd(self.manager)
+        # then
+        for value in range(8):
+            obs = self.vocabulary.decode(self.vocabulary.full, value)
+            self.assertEqual(formula.bool(Obs(states=obs)), self.manager.evaluate(node, value))
+
+    def test_given_obs_when_accepts_then_same_as_evaluate_and_assignments(self):
+        # given
+        obs = Obs(formula=Formula(['a', 'or', ['not', 'c']]))
+        node = obs.to_bdd(self.manager)
+        # when
+        accepts = obs.accepts(self.manager)
+        # then
+        self.assertIs(accepts, obs.accepts(self.manager))
+        self.assertEqual(0b101, accepts.support)
+        for value in range(8):
+            self.assertEqual(self.manager.evaluate(node, value), accepts(value))
+        self.assertCountEqual(
+            list(self.manager.assignments(node, self.vocabulary.full)), list(accepts.assignments(self.vocabulary.full))
+        )
+
+    def test_given_unknown_fluent_when_accepts_then_nothing_accepted(self):
+        # given
+        obs = Obs(formula=Formula(['d', 'or', 'a']))
+        # when
+        accepts = obs.accepts(self.manager)
+        # then
+        self.assertFalse(any(accepts(value) for value in range(8)))
+        self.assertEqual([], list(accepts.assignments(self.vocabulary.full)))
+
+    def test_given_many_fluents_when_effect_then_single_result(self):
+        # given
+        names = [f'f{i}' for i in range(70)]
+        effect = [names[0]]
+        for name in names[1:]:
+            effect.extend(['and', name])
+        statements = [
+            EffectStatement(action=Action('go'), agent=Agent('a'), precondition=Formula(), formula=Formula(effect))
+        ]
+        obs = Obs(states=[State(name, holds=False) for name in names])
+        # when
+        results = Action('go').run(obs, statements)
+        # then
+        self.assertEqual([Obs(states=[State(name, holds=True) for name in names])], results)
+
+
+if __name__ == '__main__':
+    unittest.main()
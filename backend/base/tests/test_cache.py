@@ -0,0 +1,84 @@
+import copy
+import json
+import os
+import unittest
+from unittest import mock
+
+from backend import master
+from backend.cache import ResultCache, scenario_hash
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..', '..')
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(ROOT, 'taxi-1.json')) as f:
+            self.data = json.load(f)
+        self.cache = ResultCache(path=':memory:')
+
+    def test_given_reordered_data_with_spaces_when_hashed_then_same_hash(self):
+        # given
+        other = copy.deepcopy(self.data)
+        other['AGENT'].reverse()
+        other['STATE'].reverse()
+        statement = other['STATEMENT'][0]
+        statement['original_expression'] = '  ' + statement['original_expression'].replace(' ', '   ')
+        # when
+        result = scenario_hash(other)
+        # then
+        self.assertEqual(scenario_hash(self.data), result)
+
+    def test_given_other_engine_or_queries_when_hashed_then_other_hash(self):
+        # given
+        other = copy.deepcopy(self.data)
+        other['QUERY'].reverse()
+        # when
+        result = [scenario_hash(other), scenario_hash(self.data, engine='graph')]
+        # then
+        self.assertNotIn(scenario_hash(self.data), result)
+
+    def test_given_cached_result_when_run_cached_then_queries_not_run(self):
+        # given
+        expected = master.run_cached(self.data, cache=self.cache)
+        # when
+        with mock.patch.object(master, '_run_queries', wraps=master._run_queries) as run_queries:
+            result = master.run_cached(self.data, cache=self.cache)
+            master.run_cached(self.data, cache=self.cache, bypass=True)
+        # then
+        self.assertEqual(expected, result)
+        self.assertEqual(1, run_queries.call_count)
+        self.assertEqual(1, self.cache.hits)
+
+    def test_given_budget_exceeded_when_run_cached_then_not_stored(self):
+        # given
+        with open(os.path.join(ROOT, 'shopping.json')) as f:
+            data = json.load(f)
+        budget = master.FrontierBudget(memory=1, total=1)
+        # when
+        results = master.run_cached(data, cache=self.cache, budget=budget)
+        # then
+        self.assertTrue(any('exceeds the budget' in msg for msg in results.values()))
+        self.assertEqual(0, len(self.cache))
+
+    def test_given_no_cache_when_run_cached_then_default_cache_closed(self):
+        # given
+        cache = mock.Mock(get=mock.Mock(return_value={1: 'True'}))
+        # when
+        with mock.patch.object(master, 'ResultCache', return_value=cache):
+            result = master.run_cached(self.data)
+        # then
+        self.assertEqual({1: 'True'}, result)
+        cache.close.assert_called_once_with()
+
+    def test_given_full_cache_when_put_then_least_recently_used_evicted(self):
+        # given
+        cache = ResultCache(path=':memory:', maxsize=2)
+        cache.put('a', {1: 'True'})
+        cache.put('b', {1: 'False'})
+        cache.get('a')
+        # when
+        cache.put('c', {1: 'True'})
+        # then
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual({1: 'True'}, cache.get('a'))
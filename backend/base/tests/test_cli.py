@@ -0,0 +1,55 @@
+import contextlib
+import io
+import json
+import os
+import unittest
+from unittest import mock
+
+from backend import __main__ as cli
+from backend import master
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..', '..')
+
+
+class CliTestCase(unittest.TestCase):
+    def run_main(self, argv, stdin=''):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), mock.patch('sys.stdin', io.StringIO(stdin)):
+            status = cli.main(argv)
+        return status, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_given_glob_and_stdin_when_main_then_line_per_query_in_order(self):
+        # given
+        path = os.path.join(ROOT, 'taxi-1.json')
+        with open(path) as f:
+            text = f.read()
+        expected = master.run_queries(master.parse_data(json.loads(text)))
+        # when
+        status, lines = self.run_main([os.path.join(ROOT, 'taxi-[1].json'), '-', '--workers', '1'], stdin=text)
+        # then
+        self.assertEqual(0, status)
+        self.assertEqual([path] * len(expected) + ['-'] * len(expected), [line['file'] for line in lines])
+        self.assertEqual(list(expected.values()) * 2, [line['result'] for line in lines])
+        self.assertEqual('agent traveler is active', lines[0]['expression'])
+
+    def test_given_missing_file_when_main_then_error_line_and_failure(self):
+        # when
+        status, lines = self.run_main(['missing.json', '--workers', '1'])
+        # then
+        self.assertEqual(1, status)
+        self.assertEqual(['missing.json'], [line['file'] for line in lines])
+        self.assertIn('error', lines[0])
+
+    def test_given_unexpected_error_when_main_then_only_json_lines_on_stdout(self):
+        # given
+        path = os.path.join(ROOT, 'shopping.json')
+        errors = io.StringIO()
+        failing = mock.Mock(side_effect=lambda queries, **_: [RuntimeError('boom')] * len(queries))
+        # when
+        with mock.patch('backend.master.run_batch', failing), contextlib.redirect_stderr(errors):
+            status, lines = self.run_main([path, '--workers', '1'])
+        # then
+        self.assertEqual(0, status)
+        self.assertTrue(lines)
+        self.assertEqual({master._UNEXPECTED}, {line['result'] for line in lines})
+        self.assertIn('RuntimeError: boom', errors.getvalue())
@@ -1,6 +1,7 @@
 import unittest
 
-from backend.base import Formula, State, Obs
+from backend.base import Formula, State, Obs, LogicException, Vocabulary
+from backend.base.formula import build_tree
 
 
 class FormulaTestCase(unittest.TestCase):
@@ -280,6 +281,74 @@ class FormulaTestCase(unittest.TestCase):
             ],
             list(map(lambda x: x.states, possibilities)))
 
+    def test_given_formula_when_compile_then_cached(self):
+        # given
+        formula = Formula(["a", "and", ["not", "b"]])
+        vocabulary = Vocabulary.from_states([State("a"), State("b")])
+        # when
+        compiled = formula.compile(vocabulary)
+        # then
+        self.assertIs(compiled, formula.compile(vocabulary))
+        self.assertTrue(compiled(vocabulary.encode([State("a", holds=True), State("b", holds=False)])))
+        self.assertFalse(compiled(vocabulary.encode([State("a", holds=True), State("b", holds=True)])))
+
+    def test_given_missing_fluent_when_bool_then_raises(self):
+        # given
+        formula = Formula(["a", "or", "c"])
+        obs = Obs(states=[State("a", holds=True)])
+        # when
+        with self.assertRaises(LogicException):
+            # then
+            formula.bool(obs)
+
+    def test_given_missing_fluent_when_compile_not_strict_then_false(self):
+        # given
+        formula = Formula(["not", "c"])
+        vocabulary = Vocabulary.from_states([State("a")])
+        # when
+        accepts = formula.compile(vocabulary, strict=False)
+        # then
+        self.assertFalse(accepts(vocabulary.encode([State("a", holds=True)])))
+
+    def test_given_nested_formula_when_build_tree_then_left_associative(self):
+        # given
+        formula = Formula(["a", "implies", "b", "implies", ["not", "c"]])
+        # when
+        tree = build_tree(formula.structure)
+        # then
+        self.assertEqual(
+            ("implies", ("implies", ("fluent", "a"), ("fluent", "b")), ("not", ("fluent", "c"))),
+            tree)
+
+    def test_given_many_fluents_when_all_possibilities_then_packed_masks(self):
+        # given
+        names = [f"f{i}" for i in range(12)]
+        structure = [names[0]]
+        for name in names[1:]:
+            structure.extend(["and", ["not", name]])
+        formula = Formula(structure)
+        # when
+        possibilities = formula.get_all_possibilities()
+        # then
+        self.assertEqual(len(possibilities), 1)
+        self.assertEqual(int(possibilities.masks[0]), 1)
+        self.assertEqual(possibilities[0].get_by_name("f0"), State("f0", holds=True))
+        self.assertEqual(possibilities[0].get_by_name("f11"), State("f11", holds=False))
+
+    def test_given_many_fluents_when_satisfying_masks_then_same_as_interpreter(self):
+        # given
+        names = [f"f{i}" for i in range(8)]
+        formula = Formula([[names[0], "or", names[1]], "implies", [names[2], "if and only if", names[7]]])
+        evaluate = formula.compile()
+        # when
+        masks = set(formula.satisfying_masks(names).tolist())
+        # then
+        expected = {
+            packed for packed in range(1 << len(names))
+            if evaluate(Obs(states=[State(name, holds=bool(packed >> i & 1)) for i, name in enumerate(names)]))
+        }
+        self.assertEqual(expected, masks)
+
 
 if __name__ == '__main__':
     unittest.main()
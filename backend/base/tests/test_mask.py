@@ -0,0 +1,66 @@
+import unittest
+
+from backend.base import Formula, State, Obs, LogicException
+from backend.base.mask import Vocabulary, MaskObs
+
+
+class MaskObsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.vocabulary = Vocabulary.from_states([State('a'), State('b'), State('c')])
+
+    def test_given_obs_when_encode_then_decodes_to_same_states(self):
+        # given
+        obs = Obs(states=[State('a', holds=True), State('b', holds=False), State('c', holds=True)])
+        # when
+        encoded = self.vocabulary.encode(obs.states)
+        # then
+        self.assertEqual(encoded.known, 0b111)
+        self.assertEqual(encoded.value, 0b101)
+        self.assertEqual(obs.states, encoded.states)
+        self.assertEqual(encoded, obs)
+
+    def test_given_unknown_fluent_when_encode_then_none(self):
+        # when
+        encoded = self.vocabulary.encode([State('d')])
+        # then
+        self.assertIsNone(encoded)
+
+    def test_given_partial_obs_when_is_superset_then_compares_known_fluents(self):
+        # given
+        model = MaskObs(vocabulary=self.vocabulary, known=0b111, value=0b011)
+        possibility = self.vocabulary.encode([State('a', holds=True), State('c', holds=False)])
+        other = self.vocabulary.encode([State('a', holds=True), State('c', holds=True)])
+        # then
+        self.assertTrue(possibility.is_superset(model))
+        self.assertFalse(other.is_superset(model))
+
+    def test_given_postcondition_when_updated_then_bits_set_and_cleared(self):
+        # given
+        obs = MaskObs(vocabulary=self.vocabulary, known=0b111, value=0b001)
+        # when
+        new_obs = obs.updated([State('a', holds=False), State('b', holds=True)])
+        # then
+        self.assertEqual(new_obs.value, 0b010)
+        self.assertEqual(obs.value, 0b001)
+
+    def test_given_disjoint_postcondition_when_updated_then_raises(self):
+        # given
+        obs = MaskObs(vocabulary=self.vocabulary, known=0b111, value=0b000)
+        # when
+        with self.assertRaises(LogicException):
+            # then
+            obs.updated([State('a', holds=False), State('a', holds=True)])
+
+    def test_given_mask_obs_when_formula_bool_then_same_as_obs(self):
+        # given
+        formula = Formula(['a', 'and', ['not', 'b']])
+        obs = Obs(states=[State('a', holds=True), State('b', holds=False), State('c', holds=False)])
+        # when
+        ans = formula.bool(self.vocabulary.encode(obs.states))
+        # then
+        self.assertEqual(formula.bool(obs), ans)
+
+
+if __name__ == '__main__':
+    unittest.main()
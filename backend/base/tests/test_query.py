@@ -1,16 +1,24 @@
+import pickle
+from dataclasses import replace
 from typing import List
 import unittest
+from unittest import mock
 
-from backend.base.exception import LogicException
+from backend.base.exception import LogicException, BudgetException
 from backend.base import scenario
 from backend.base.action import Action
+from backend.base.checkpoint import Checkpoints, prefix_keys
+from backend.base.stats import collect
 from backend.base.agent import Agent
 from backend.base.formula import Formula
-from backend.base.query import Query, ActionQuery, AgentQuery, FormulaQuery
+from backend.base.graph import StateGraph
+from backend.base.spill import FrontierBudget, SpilledModels
+from backend.base.query import Query, ActionQuery, AgentQuery, FormulaQuery, TransitionCache, run_batch
 from backend.base.state import State
 
 from backend.base.statement import EffectStatement, ReleaseStatement, Statement
 from backend.base.timepoint import Obs, TimePoint
+from backend import master
 
 
 class QueryTestCase(unittest.TestCase):
@@ -325,3 +333,501 @@ class QueryTestCase(unittest.TestCase):
         with self.assertRaises(LogicException):
             # then
             query.run()
+
+    def test_given_many_queries_when_run_batch_then_one_simulation(self):
+        # given
+        queries = [
+            FormulaQuery(scenario=self.scenario, termination=5, states=self.states,
+                         formula=Formula(['letter sent']), mode='necessary', time=3),
+            AgentQuery(scenario=self.scenario, termination=5, states=self.states, agent=Agent('Postman')),
+            FormulaQuery(scenario=self.scenario, termination=5, states=self.states,
+                         formula=Formula(['letter sent']), mode='necessary', time=3),
+            ActionQuery(scenario=self.scenario, termination=5, states=self.states,
+                        action=Action('write letter'), time=3),
+        ]
+        # when
+        with mock.patch.object(Query, 'run', autospec=True, side_effect=Query.run) as run:
+            results = run_batch(queries)
+        # then
+        self.assertEqual(1, run.call_count)
+        self.assertEqual([True, False, True, False], results)
+
+    def test_given_not_realizable_scenario_when_run_batch_then_exception_for_each_query(self):
+        # given
+        queries = [
+            AgentQuery(scenario=self.not_realizable_multiple_scenario, termination=5, states=self.states,
+                       agent=Agent('Postman')),
+            ActionQuery(scenario=self.not_realizable_multiple_scenario, termination=5, states=self.states,
+                        action=Action('read letter'), time=4),
+        ]
+        # when
+        results = run_batch(queries)
+        # then
+        self.assertEqual(2, len(results))
+        for result in results:
+            self.assertIsInstance(result, LogicException)
+
+    def test_given_release_when_run_then_models_share_path(self):
+        # given
+        query = Query(
+            scenario=self.scenario,
+            termination=100, states=self.states)
+        # when
+        first, second = query.run()
+        # then
+        self.assertEqual([0, 2, 3, 4, 5], [timepoint.t for timepoint in first.path])
+        self.assertIsNot(first.head, second.head)
+        self.assertIs(first.head.parent.parent, second.head.parent)
+
+    def test_given_graph_engine_when_run_batch_then_same_as_paths(self):
+        # given
+        queries = [
+            FormulaQuery(scenario=_scenario, termination=5, states=self.states, formula=Formula(formula),
+                         mode=mode, time=time)
+            for _scenario in [self.scenario, self.multiple_scenario]
+            for formula in [['letter delivered'], ['letter read', 'or', ['not', 'letter delivered']]]
+            for mode in ['necessary', 'possibly']
+            for time in [-1, 3, 4, 5]
+        ]
+        queries.append(ActionQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                                   action=Action('read letter'), time=4))
+        # when
+        results = run_batch(queries, engine='graph')
+        # then
+        self.assertEqual(run_batch(queries), results)
+
+    def test_given_repeated_release_when_graph_then_one_node_per_state(self):
+        # given
+        statements = [
+            ReleaseStatement(action=Action('toss'), agent=Agent('Player'), precondition=Formula(),
+                             postcondition=State('heads')),
+        ]
+        _scenario = scenario.Scenario.from_timepoints(
+            statements=statements,
+            timepoints=[TimePoint(t=t, acs=(Action('toss'), Agent('Player'))) for t in range(40)] + [
+                TimePoint(t=40, obs=Obs(formula=Formula(['heads'])))
+            ])
+        # when
+        graph = StateGraph.build(_scenario, termination=50, states=[State('heads')])
+        # then
+        self.assertEqual(41, len(graph.layers))
+        self.assertTrue(all(len(layer) == 2 for layer in graph.layers[:-1]))
+        self.assertEqual([1], list(graph.states_at(40)))
+
+    def test_given_final_obs_when_graph_then_unreachable_states_pruned(self):
+        # given
+        statements = [
+            ReleaseStatement(action=Action('toss'), agent=Agent('Player'), precondition=Formula(),
+                             postcondition=State('heads')),
+            EffectStatement(action=Action('look'), agent=Agent('Player'), precondition=Formula(['heads']),
+                            formula=Formula(['seen'])),
+        ]
+        _scenario = scenario.Scenario.from_timepoints(
+            statements=statements,
+            timepoints=[
+                TimePoint(t=0, obs=Obs(formula=Formula([['not', 'heads'], 'and', ['not', 'seen']])),
+                          acs=(Action('toss'), Agent('Player'))),
+                TimePoint(t=1, acs=(Action('look'), Agent('Player'))),
+                TimePoint(t=2, obs=Obs(formula=Formula(['seen']))),
+            ])
+        query = FormulaQuery(scenario=_scenario, termination=5, states=[State('heads'), State('seen')],
+                             formula=Formula(['heads']), mode='necessary', time=1, engine='graph')
+        # when
+        result = query.run()
+        # then
+        self.assertTrue(result)
+
+    def test_given_graph_engine_when_agent_queries_then_one_graph_for_all_agents(self):
+        # given
+        queries = [
+            AgentQuery(scenario=self.multiple_scenario, termination=5, states=self.states, agent=Agent(agent))
+            for agent in ['Sender', 'Postman', 'Receiver', 'Nobody']
+        ]
+        # when
+        with mock.patch.object(StateGraph, 'build', side_effect=StateGraph.build) as build:
+            results = run_batch(queries, engine='graph')
+        # then
+        self.assertEqual(1, build.call_count)
+        self.assertEqual(run_batch(queries), results)
+        self.assertEqual([True, True, True, False], results)
+
+    def test_given_shared_transition_cache_when_run_then_transitions_computed_once(self):
+        # given
+        transitions = TransitionCache(self.multiple_scenario)
+        query = Query(scenario=self.multiple_scenario, termination=5, states=self.states)
+        # when
+        first = query.run(transitions)
+        misses = transitions.misses
+        second = query.run(transitions)
+        # then
+        self.assertEqual(4, misses)
+        self.assertEqual(misses, transitions.misses)
+        self.assertEqual(len(first), len(second))
+        self.assertGreaterEqual(transitions.hits, misses)
+
+    def test_given_full_transition_cache_when_run_then_oldest_evicted(self):
+        # given
+        transitions = TransitionCache(self.scenario, maxsize=2)
+        query = Query(scenario=self.scenario, termination=5, states=self.states)
+        # when
+        query.run(transitions)
+        # then
+        self.assertEqual(2, len(transitions))
+
+    def test_given_dfs_engine_when_run_batch_then_same_as_paths(self):
+        # given
+        queries = [
+            FormulaQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                         formula=Formula(['letter delivered']), mode=mode, time=time)
+            for mode in ['necessary', 'possibly']
+            for time in [-1, 3, 4]
+        ] + [
+            AgentQuery(scenario=self.multiple_scenario, termination=5, states=self.states, agent=Agent('Postman')),
+            ActionQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                        action=Action('read letter'), time=4),
+        ]
+        # when
+        results = run_batch(queries, engine='dfs')
+        # then
+        self.assertEqual(run_batch(queries), results)
+
+    def test_given_witness_in_first_model_when_dfs_then_stops_early(self):
+        # given
+        statements = [
+            ReleaseStatement(action=Action('toss'), agent=Agent('Player'), precondition=Formula(),
+                             postcondition=State('heads')),
+        ]
+        _scenario = scenario.Scenario.from_timepoints(
+            statements=statements,
+            timepoints=[TimePoint(t=t, acs=(Action('toss'), Agent('Player'))) for t in range(60)])
+        query = FormulaQuery(scenario=_scenario, termination=100, states=[State('heads')],
+                             formula=Formula(['heads']), mode='possibly', time=30, engine='dfs')
+        # when
+        result = query.run()
+        # then
+        self.assertTrue(result)
+
+    def test_given_not_realizable_scenario_when_dfs_then_raises(self):
+        # given
+        query = AgentQuery(scenario=self.not_realizable_multiple_scenario, termination=5, states=self.states,
+                           agent=Agent('Postman'), engine='dfs')
+        # when
+        with self.assertRaises(LogicException):
+            # then
+            query.run()
+
+    def test_given_numpy_engine_when_run_batch_then_same_as_paths(self):
+        # given
+        statements = self.statements + [
+            EffectStatement(action=Action('write letter'), agent=Agent('Sender'), precondition=Formula(),
+                            formula=Formula(['letter sent', 'or', 'letter read'])),
+            ReleaseStatement(action=Action('send letter'), agent=Agent('Sender'), precondition=Formula(),
+                             postcondition=State('letter ready', holds=False)),
+            ReleaseStatement(action=Action('read letter'), agent=Agent('Receiver'),
+                             precondition=Formula(['letter read']), postcondition=State('letter read')),
+        ]
+        queries = []
+        for _scenario in [self.scenario, self.multiple_scenario, scenario.Scenario(
+                statements=statements, timepoints=self.multiple_scenario.timepoints)]:
+            queries += [
+                FormulaQuery(scenario=_scenario, termination=5, states=self.states, formula=Formula([fluent]),
+                             mode=mode, time=time)
+                for fluent in ['letter sent', 'letter delivered', 'letter read']
+                for mode in ['necessary', 'possibly']
+                for time in [2, 3, 5]
+            ]
+            queries += [
+                AgentQuery(scenario=_scenario, termination=5, states=self.states, agent=Agent(agent))
+                for agent in ['Sender', 'Postman', 'Receiver']
+            ]
+        # when
+        results = run_batch(queries, engine='numpy')
+        # then
+        self.assertEqual(run_batch(queries), results)
+
+    def test_given_query_with_compiled_formula_when_pickled_then_same_answer(self):
+        # given
+        query = FormulaQuery(scenario=self.scenario, termination=5, states=self.states,
+                             formula=Formula(['letter sent']), mode='necessary', time=3)
+        expected = query.run()
+        # when
+        result = pickle.loads(pickle.dumps(query)).run()
+        # then
+        self.assertEqual(expected, result)
+
+    def test_given_workers_when_run_queries_then_same_messages_in_order(self):
+        # given
+        queries = [
+            AgentQuery(scenario=self.not_realizable_multiple_scenario, termination=5, states=self.states,
+                       agent=Agent('Postman')),
+        ] + [
+            FormulaQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                         formula=Formula(['letter delivered']), mode=mode, time=time)
+            for mode in ['necessary', 'possibly']
+            for time in [2, 4]
+        ]
+        data = {'queries': queries, 'scenario': self.multiple_scenario, 'states': self.states}
+        # when
+        with mock.patch.object(master, '_PARALLEL_MIN_WORK', 0):
+            result = master.run_queries(data, engine='dfs', workers=2)
+        # then
+        self.assertEqual(master.run_queries(data, engine='dfs'), result)
+        self.assertEqual("LogicException('This scenario is not realizable')", result[1])
+
+    def test_given_single_simulation_when_run_queries_with_workers_then_frontier_split_gives_same_messages(self):
+        # given
+        queries = [
+            FormulaQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                         formula=Formula(['letter delivered']), mode=mode, time=time)
+            for mode in ['necessary', 'possibly']
+            for time in [2, 4]
+        ]
+        data = {'queries': queries, 'scenario': self.multiple_scenario, 'states': self.states}
+        # when
+        with mock.patch.object(master, '_PARALLEL_MIN_WORK', 0), mock.patch.object(master, '_SPLIT_FRONTIER', 2):
+            result = master.run_queries(data, workers=2)
+        # then
+        self.assertEqual(master.run_queries(data), result)
+
+    def test_given_budget_when_run_queries_with_workers_then_spilled_frontier_split_in_parts_within_budget(self):
+        # given
+        queries = [
+            FormulaQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                         formula=Formula(['letter delivered']), mode=mode, time=time)
+            for mode in ['necessary', 'possibly']
+            for time in [2, 4]
+        ]
+        data = {'queries': queries, 'scenario': self.multiple_scenario, 'states': self.states}
+        budget = FrontierBudget(memory=2)
+        # when
+        with mock.patch.object(master, '_PARALLEL_MIN_WORK', 0), mock.patch.object(master, '_SPLIT_FRONTIER', 2), \
+                mock.patch.object(master, '_parts', wraps=master._parts) as parts:
+            result = master.run_queries(data, workers=2, budget=budget)
+        # then
+        self.assertEqual(master.run_queries(data), result)
+        (models, size), _ = parts.call_args
+        self.assertIsInstance(models, SpilledModels)
+        self.assertEqual(1, size)
+
+    def test_given_edited_last_timepoint_when_checkpoints_simulate_then_resumes_before_it(self):
+        # given
+        timepoints = list(self.multiple_scenario.timepoints.values())
+        edited = scenario.Scenario.from_timepoints(statements=self.statements, timepoints=timepoints[:-1] + [
+            TimePoint(t=4, acs=(Action('read letter'), Agent('Receiver')))
+        ])
+        checkpoints = Checkpoints()
+        queries = [
+            FormulaQuery(scenario=_scenario, termination=5, states=self.states,
+                         formula=Formula(['letter read']), mode='possibly', time=5)
+            for _scenario in [self.multiple_scenario, edited]
+        ]
+        checkpoints.simulate(queries[0])
+        # when
+        models = checkpoints.simulate(queries[1])
+        # then
+        self.assertEqual(Query.run(queries[1]), models)
+        self.assertEqual(4, checkpoints.hits)
+        self.assertEqual(6, checkpoints.misses)
+        self.assertEqual(6, len(checkpoints))
+
+    def test_given_simulated_scenario_when_prefix_keys_then_same_keys(self):
+        # given
+        query = Query(scenario=self.multiple_scenario, termination=5, states=self.states)
+        expected = prefix_keys(query)
+        # when
+        run_batch([FormulaQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                                formula=Formula(['letter sent']), mode='necessary', time=3)])
+        # then
+        self.assertEqual(expected, prefix_keys(query))
+
+    def test_given_checkpoints_when_run_queries_then_same_messages(self):
+        # given
+        queries = [
+            FormulaQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                         formula=Formula(['letter delivered']), mode=mode, time=time)
+            for mode in ['necessary', 'possibly']
+            for time in [2, 4]
+        ]
+        data = {'queries': queries, 'scenario': self.multiple_scenario, 'states': self.states}
+        checkpoints = Checkpoints()
+        # when
+        first = master.run_queries(data, checkpoints=checkpoints)
+        second = master.run_queries(data, checkpoints=checkpoints)
+        # then
+        self.assertEqual(master.run_queries(data), first)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.multiple_scenario.timepoints), checkpoints.hits)
+
+    def test_given_collect_when_run_then_frontier_branching_and_pruning_counted(self):
+        # given
+        query = Query(scenario=self.multiple_scenario, termination=5, states=self.states)
+        # when
+        with collect() as stats:
+            models = query.run()
+        # then
+        self.assertEqual((4, len(models)), stats.frontier[-1])
+        self.assertEqual([1, 2, 3, 4], [t for t, _ in stats.branching])
+        self.assertEqual([0, 4], [t for t, _ in stats.pruned])
+        self.assertEqual(4, stats.transitions)
+
+    def test_given_stats_when_run_queries_then_same_messages_with_stats(self):
+        # given
+        queries = [
+            FormulaQuery(scenario=self.multiple_scenario, termination=5, states=self.states,
+                         formula=Formula(['letter delivered']), mode='possibly', time=time)
+            for time in [2, 4]
+        ]
+        data = {'queries': queries, 'scenario': self.multiple_scenario, 'states': self.states}
+        # when
+        result, stats = master.run_queries(data, stats=True)
+        # then
+        self.assertEqual(master.run_queries(data), result)
+        self.assertEqual(['simulate', 'evaluate'], list(stats.seconds))
+        self.assertEqual(stats.transitions, stats.cache_misses)
+
+    def test_given_memory_budget_when_run_then_same_models_spilled(self):
+        # given
+        query = Query(scenario=self.multiple_scenario, termination=5, states=self.states)
+        expected = query.run()
+        # when
+        result = replace(query, budget=FrontierBudget(memory=1)).run()
+        # then
+        self.assertEqual(expected, list(result))
+        self.assertEqual(len(expected), len(result))
+
+    def test_given_total_budget_exceeded_when_run_then_budget_exception_with_frontier_size(self):
+        # given
+        query = Query(scenario=self.multiple_scenario, termination=5, states=self.states,
+                      budget=FrontierBudget(memory=1, total=1))
+        # when
+        with self.assertRaises(BudgetException) as context:
+            query.run()
+        # then
+        self.assertIn('Frontier of 2 models', str(context.exception))
+
+    def test_given_queries_on_few_fluents_when_run_batch_then_sliced_same_as_unsliced(self):
+        # given
+        statements = self.statements + [
+            EffectStatement(action=Action('write letter'), agent=Agent('Sender'), precondition=Formula(),
+                            formula=Formula(['stamp bought', 'or', 'stamp used'])),
+            ReleaseStatement(action=Action('send letter'), agent=Agent('Sender'),
+                             precondition=Formula(['stamp bought']), postcondition=State('stamp used')),
+        ]
+        states = self.states + [State(name='stamp bought'), State(name='stamp used')]
+        queries = []
+        for timepoints in [self.scenario.timepoints, self.multiple_scenario.timepoints]:
+            _scenario = scenario.Scenario(statements=statements, timepoints=timepoints)
+            self.assertEqual(set(_state.name for _state in self.states), _scenario.cone_of_influence(set(), states))
+            queries += [
+                FormulaQuery(scenario=_scenario, termination=5, states=states, formula=Formula([fluent]),
+                             mode=mode, time=time)
+                for fluent in ['letter ready', 'letter delivered']
+                for mode in ['necessary', 'possibly']
+                for time in [2, 5]
+            ]
+            queries.append(ActionQuery(scenario=_scenario, termination=5, states=states,
+                                       action=Action('send letter'), time=2))
+        for engine in ['paths', 'graph', 'dfs', 'numpy']:
+            # when
+            results = run_batch(queries, engine=engine)
+            # then
+            self.assertEqual(run_batch(queries, engine=engine, slicing=False), results)
+
+    def test_given_independent_fluents_when_run_batch_then_decomposed_same_as_whole(self):
+        # given
+        statements = self.statements + [
+            EffectStatement(action=Action('write letter'), agent=Agent('Sender'), precondition=Formula(),
+                            formula=Formula(['stamp bought', 'or', 'stamp used'])),
+            ReleaseStatement(action=Action('deliver letter'), agent=Agent('Postman'),
+                             precondition=Formula(['stamp bought']), postcondition=State('stamp used')),
+        ]
+        states = self.states + [State(name='stamp bought'), State(name='stamp used')]
+        queries = []
+        for timepoints in [self.multiple_scenario.timepoints, self.not_realizable_multiple_scenario.timepoints]:
+            _scenario = scenario.Scenario(statements=statements, timepoints=timepoints)
+            self.assertEqual(2, len(_scenario.components([], states)))
+            queries += [
+                FormulaQuery(scenario=_scenario, termination=5, states=states, formula=Formula([fluent]),
+                             mode=mode, time=time)
+                for fluent in ['stamp used', 'letter delivered']
+                for mode in ['necessary', 'possibly']
+                for time in [2, 5]
+            ]
+            queries += [
+                AgentQuery(scenario=_scenario, termination=5, states=states, agent=Agent(agent))
+                for agent in ['Sender', 'Postman', 'Receiver']
+            ]
+            queries.append(ActionQuery(scenario=_scenario, termination=5, states=states,
+                                       action=Action('send letter'), time=2))
+        for engine in ['paths', 'graph', 'dfs', 'numpy']:
+            # when
+            results = [repr(result) for result in run_batch(queries, engine=engine)]
+            # then
+            self.assertEqual([repr(result) for result in run_batch(queries, engine=engine, decomposition=False)],
+                             results)
+
+    def test_given_obs_of_many_conjuncts_when_run_batch_then_error_per_query_like_whole(self):
+        # given
+        flat = ['letter ready']
+        for i in range(1200):
+            flat += ['and', ['not', 'letter read'] if i % 2 else 'letter ready']
+        _scenario = scenario.Scenario.from_timepoints(
+            statements=self.statements,
+            timepoints=[TimePoint(t=0, obs=Obs(formula=Formula(flat))),
+                        TimePoint(t=1, acs=(Action('write letter'), Agent('Sender')))]
+        )
+        queries = [
+            FormulaQuery(scenario=_scenario, termination=3, states=self.states, formula=Formula(['letter ready']),
+                         mode='necessary', time=2),
+            AgentQuery(scenario=_scenario, termination=3, states=self.states, agent=Agent('Sender')),
+        ]
+        # when
+        results = [repr(result) for result in run_batch(queries)]
+        # then
+        self.assertEqual([repr(result) for result in run_batch(queries, decomposition=False)], results)
+
+    def test_given_deeply_nested_precondition_when_run_batch_then_error_per_query_like_unsliced(self):
+        # given
+        precondition = 'letter ready'
+        for _ in range(1200):
+            precondition = ['not', precondition]
+        statements = self.statements + [
+            EffectStatement(action=Action('write letter'), agent=Agent('Sender'), precondition=Formula([precondition]),
+                            formula=Formula(['letter read'])),
+        ]
+        _scenario = scenario.Scenario(statements=statements, timepoints=self.scenario.timepoints)
+        queries = [
+            FormulaQuery(scenario=_scenario, termination=3, states=self.states, formula=Formula(['letter ready']),
+                         mode='necessary', time=2),
+        ]
+        # when
+        results = [repr(result) for result in run_batch(queries)]
+        # then
+        self.assertEqual([repr(result) for result in run_batch(queries, slicing=False, decomposition=False)],
+                         results)
+
+    def test_given_contradicting_effects_of_action_when_run_batch_then_other_effects_blocked_too(self):
+        # given
+        statements = [
+            EffectStatement(action=Action('x'), agent=Agent('a'), precondition=Formula(['f2']),
+                            formula=Formula(['f0'])),
+            EffectStatement(action=Action('x'), agent=Agent('a'), precondition=Formula(['f3']),
+                            formula=Formula([['not', 'f0']])),
+            EffectStatement(action=Action('x'), agent=Agent('a'), precondition=Formula(), formula=Formula(['f1'])),
+        ]
+        states = [State(name=f'f{i}') for i in range(4)]
+        acs = TimePoint(t=1, acs=(Action('x'), Agent('a')))
+        obs = TimePoint(t=0, obs=Obs(formula=Formula([['f2', 'and', 'f3'], 'and', ['not', 'f1']])))
+        for timepoints in [[acs], [obs, acs]]:
+            _scenario = scenario.Scenario.from_timepoints(statements=statements, timepoints=timepoints)
+            self.assertEqual(1, len(_scenario.components([], states)))
+            queries = [
+                FormulaQuery(scenario=_scenario, termination=3, states=states, formula=Formula(['f1']),
+                             mode='necessary', time=2),
+                AgentQuery(scenario=_scenario, termination=3, states=states, agent=Agent('a')),
+            ]
+            # when
+            results = run_batch(queries)
+            # then
+            self.assertEqual([False, False], results)
+            self.assertEqual(run_batch(queries, decomposition=False), results)
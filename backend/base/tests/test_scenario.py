@@ -4,6 +4,7 @@ from backend.base.agent import Agent
 from backend.base.formula import Formula
 from backend.base.scenario import Scenario
 from backend.base.state import State
+from backend.base.statement import EffectStatement, ReleaseStatement
 from backend.base.timepoint import Obs, TimePoint
 
 
@@ -102,3 +103,102 @@ class ScenarioTestCase(unittest.TestCase):
             ],
             first_obs
         )
+
+    def test_given_statements_when_get_statements_then_split_by_action_and_agent(self):
+        # given
+        load = EffectStatement(action=Action('load'), agent=Agent('a'), precondition=Formula(),
+                               formula=Formula(['loaded']))
+        spin = ReleaseStatement(action=Action('load'), agent=Agent('a'), precondition=Formula(),
+                                postcondition=State('loaded'))
+        other = EffectStatement(action=Action('load'), agent=Agent('b'), precondition=Formula(),
+                                formula=Formula(['loaded']))
+        shoot = EffectStatement(action=Action('shoot'), agent=Agent(None), precondition=Formula(),
+                                formula=Formula([['not', 'loaded']]))
+        scenario = Scenario(statements=[load, spin, other, shoot])
+        # then
+        self.assertEqual(((load,), (spin,)), scenario.get_statements(Action('load'), Agent('a')))
+        self.assertEqual(((other,), ()), scenario.get_statements(Action('load'), Agent('b')))
+        self.assertEqual(((shoot,), ()), scenario.get_statements(Action('shoot'), Agent('b')))
+        self.assertEqual(((), ()), scenario.get_statements(Action('wait'), Agent('a')))
+
+    def test_given_statements_when_cone_of_influence_then_only_fluents_changing_query_fluents(self):
+        # given
+        scenario = Scenario(
+            statements=[
+                EffectStatement(action=Action('a'), agent=Agent('x'), precondition=Formula(['c']),
+                                formula=Formula(['b'])),
+                EffectStatement(action=Action('d'), agent=Agent('x'), precondition=Formula(['e']),
+                                formula=Formula(['f'])),
+                ReleaseStatement(action=Action('a'), agent=Agent('x'), precondition=Formula(),
+                                 postcondition=State('g')),
+            ],
+            timepoints={
+                0: TimePoint(t=0, obs=Obs(formula=Formula(['a'])))
+            }
+        )
+        states = [State(name) for name in 'abcdefg']
+        # when
+        cone = scenario.cone_of_influence({'b'}, states)
+        # then
+        self.assertEqual({'a', 'b', 'c'}, cone)
+        self.assertEqual([scenario.statements[0]], scenario.sliced(cone).statements)
+        self.assertIsNone(scenario.cone_of_influence({'h'}, states))
+
+    def test_given_statements_and_obs_conjuncts_when_components_then_linked_fluents_together(self):
+        # given
+        scenario = Scenario(
+            statements=[
+                EffectStatement(action=Action('a'), agent=Agent('x'), precondition=Formula(['c']),
+                                formula=Formula(['b'])),
+                ReleaseStatement(action=Action('a'), agent=Agent('x'), precondition=Formula(),
+                                 postcondition=State('g')),
+            ],
+            timepoints={
+                0: TimePoint(t=0, obs=Obs(formula=Formula([['a'], 'and', ['not', 'g'], 'and', ['b', 'or', 'd']])))
+            }
+        )
+        states = [State(name) for name in 'abcdefg']
+        # when
+        components = scenario.components([['e', 'f']], states)
+        # then
+        self.assertEqual([{'a'}, {'b', 'c', 'd'}, {'e', 'f'}, {'g'}], components)
+        self.assertEqual(['b', 'or', 'd'], scenario.restricted(components[1]).timepoints[0].obs.formula.structure[0])
+        self.assertEqual([], scenario.restricted(components[2]).statements)
+
+    def test_given_obs_pinning_most_of_many_fluents_when_first_obs_then_only_open_fluents_enumerated(self):
+        # given
+        names = [f'f{i}' for i in range(40)]
+        pinned = ['not', names[0]]
+        for name in names[1:38]:
+            pinned = [pinned, 'and', name]
+        scenario = Scenario(
+            statements=[],
+            timepoints={
+                0: TimePoint(t=0, obs=Obs(formula=Formula([pinned])))
+            }
+        )
+        states = [State(name) for name in names]
+        # when
+        first_obs = scenario.get_first_obs(states=states)
+        # then
+        self.assertEqual(4, len(first_obs))
+        self.assertEqual(4, len({obs.value for obs in first_obs}))
+        for obs in first_obs:
+            self.assertEqual(sum(1 << i for i in range(1, 38)), obs.value & ((1 << 38) - 1))
+
+    def test_given_obs_open_on_many_fluents_when_first_obs_then_generated_lazily(self):
+        # given
+        names = [f'f{i}' for i in range(40)]
+        formula = names[0]
+        for name in names[1:]:
+            formula = [formula, 'or', name]
+        scenario = Scenario(
+            statements=[],
+            timepoints={
+                0: TimePoint(t=0, obs=Obs(formula=Formula([formula])))
+            }
+        )
+        # when
+        first_obs = scenario.first_obs(states=[State(name) for name in names])
+        # then
+        self.assertNotEqual(0, next(first_obs).value)
@@ -4,7 +4,7 @@ from dataclasses import dataclass
 from typing import Optional, Tuple, List
 from itertools import groupby
 
-from . import action, agent, state, formula
+from . import action, agent, state, formula, bdd
 from . import LogicException, ParsingException
 
 def intersperse(lst, item):
@@ -17,9 +17,17 @@ class Obs(list):
     states: List[state.State] = None
     formula: formula.Formula = None
 
-    def get_all_possibilities(self) -> List[Obs]:
+    def get_all_possibilities(self) -> formula.Possibilities:
         return self.formula.get_all_possibilities()
 
+    def to_bdd(self, manager: bdd.BDD) -> int:
+        """set of states accepted by the OBS, empty if it mentions a fluent outside of the vocabulary"""
+        return self.formula.to_bdd(manager, strict=False)
+
+    def accepts(self, manager: bdd.BDD) -> bdd.Acceptance:
+        """membership test of the states accepted by the OBS, compiled once per manager"""
+        return self.formula.acceptance(manager, strict=False)
+
     @classmethod
     def from_ui(cls, data: list) -> Obs:
         try:
@@ -44,6 +52,10 @@ class Obs(list):
     def __iter__(self):
         return list.__iter__(self.states)
 
+    def __reduce__(self):
+        # pickled by fields, the list base class would pickle the items through __iter__
+        return self.__class__, (self.states, self.formula)
+
     def __ior__(self, other) -> Obs:
         """validation state unique by name and holds
 
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# bump whenever a backend change can change the answer of a query, results of other versions are never read
+ENGINE_VERSION = 1
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'krr', 'results.sqlite3')
+
+# sections of the scenario data whose order does not change the answers
+_UNORDERED = ('AGENT', 'ACTION', 'STATE', 'STATEMENT')
+
+
+def canonical(data: dict) -> dict:
+    """scenario data with unordered sections sorted and whitespace of every original_expression collapsed"""
+    data = _normalize(data)
+    for key in _UNORDERED:
+        if isinstance(data.get(key), list):
+            data[key] = sorted(data[key], key=lambda item: json.dumps(item, sort_keys=True))
+    return data
+
+
+def _normalize(item):
+    if isinstance(item, dict):
+        return {
+            key: ' '.join(value.split()) if key == 'original_expression' and isinstance(value, str)
+            else _normalize(value)
+            for key, value in item.items()
+        }
+    if isinstance(item, list):
+        return [_normalize(el) for el in item]
+    return item
+
+
+def scenario_hash(data: dict, engine: str = None) -> str:
+    """hash of the domain, scenario and queries of the data, the engine and the engine version"""
+    text = json.dumps([ENGINE_VERSION, engine, canonical(data)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@dataclass(slots=True)
+class ResultCache:
+    """Query results of scenarios in a SQLite file, the least recently used are evicted above maxsize entries"""
+    path: str = DEFAULT_PATH
+    maxsize: int = 4096
+    hits: int = 0
+    misses: int = 0
+    _connection: sqlite3.Connection = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL, used INTEGER NOT NULL)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+    def get(self, key: str) -> Optional[Dict[int, str]]:
+        row = self._connection.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._connection:
+            self._connection.execute('UPDATE results SET used = ? WHERE key = ?', (self._tick(), key))
+        return {int(k): v for k, v in json.loads(row[0]).items()}
+
+    def put(self, key: str, result: Dict[int, str]) -> None:
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO results (key, result, used) VALUES (?, ?, ?)',
+                (key, json.dumps(result), self._tick())
+            )
+            self._connection.execute(
+                'DELETE FROM results WHERE key NOT IN (SELECT key FROM results ORDER BY used DESC LIMIT ?)',
+                (self.maxsize,)
+            )
+
+    def clear(self) -> None:
+        with self._connection:
+            self._connection.execute('DELETE FROM results')
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def _tick(self) -> int:
+        # a counter stored with the rows, so the recency survives restarts and does not depend on the clock
+        return self._connection.execute('SELECT COALESCE(MAX(used), 0) + 1 FROM results').fetchone()[0]
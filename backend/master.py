@@ -1,5 +1,18 @@
 from backend.base import *
+import os
+import sys
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from collections import deque
+from dataclasses import replace
+from itertools import repeat
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from backend.base import stats as engine_stats
+from backend.base.query import NOT_REALIZABLE
+from backend.base.stats import Stats
+from backend.cache import ResultCache, scenario_hash
 
 def parse_data(data: dict):
     try:
@@ -25,16 +38,270 @@ def parse_data(data: dict):
         "queries": queries,
     }
 
-def run_queries(data: dict):
-    out = {}
-    for i, query in enumerate(data['queries']):
+_UNEXPECTED = 'Something went wrong'
+
+
+class _Unexpected(Exception):
+    """unexpected error of a query answered in a worker, reported there with its traceback"""
+
+
+def _message(result) -> str:
+    if isinstance(result, BackendException):
+        return getattr(result, 'message', repr(result))
+    if isinstance(result, _Unexpected):
+        return _UNEXPECTED
+    if isinstance(result, Exception):
+        # stdout may carry results, e.g. the JSON lines of the batch runner
+        traceback.print_exception(result, file=sys.stderr)
+        return _UNEXPECTED
+    return str(result)
+
+
+def _sent(result):
+    """result of a worker as sent back, unexpected exceptions may not pickle so they are reported here"""
+    if isinstance(result, Exception) and not isinstance(result, BackendException):
+        _message(result)
+        return _Unexpected(repr(result))
+    return result
+
+
+def _storable(result) -> bool:
+    # running out of the budget says nothing about the scenario, another budget may answer it
+    if isinstance(result, Exception):
+        return isinstance(result, BackendException) and not isinstance(result, BudgetException)
+    return True
+
+
+# scenarios with less work than this (timepoints times possible states) are answered serially,
+# starting the workers would take longer than the queries
+_PARALLEL_MIN_WORK = 1 << 12
+
+# queries of the run, set once in every worker of the pool
+_worker_queries: list = []
+
+
+def _init_worker(queries: list):
+    global _worker_queries
+    _worker_queries = queries
+
+
+def _collecting(collect: bool):
+    return engine_stats.collect() if collect else nullcontext()
+
+
+def _run_chunk(indices: List[int], engine: str = None, collect: bool = False) -> Tuple[list, Optional[Stats]]:
+    """answers of the queries and the stats of the worker if collected"""
+    with _collecting(collect) as collected:
+        answers = [_sent(result) for result in run_batch([_worker_queries[i] for i in indices], engine=engine)]
+    return answers, collected
+
+
+def _run_branches(
+        indices: List[int], models: list, start: int, engine: str = None, collect: bool = False
+) -> Tuple[list, Optional[Stats]]:
+    """answers of the queries on a part of the models, None for queries of a part without realizable models,
+    and the stats of the worker if collected"""
+    out = []
+    with _collecting(collect) as collected:
+        for result in run_batch([_worker_queries[i] for i in indices], engine=engine, models=models, start=start):
+            if isinstance(result, LogicException) and result.args == (NOT_REALIZABLE,):
+                result = None
+            out.append(_sent(result))
+    return out, collected
+
+
+def _merge(collected: Optional[Stats]) -> None:
+    """adds stats of a worker to the stats collected by this process"""
+    if collected is not None and engine_stats.current is not None:
+        engine_stats.current.merge(collected)
+
+
+# the frontier of a single simulation is split once it has this many models
+_SPLIT_FRONTIER = 64
+# parts of the frontier per worker, smaller parts skip more work once the answers are decided
+_PARTS_PER_WORKER = 4
+
+
+def _run_split(pool: ProcessPoolExecutor, workers: int, queries: list, engine: str = None) -> list:
+    """Answers queries sharing one simulation by splitting its frontier into parts simulated in the pool.
+
+    The frontier is advanced serially until it is large enough (paths and dfs engines, the graph engines
+    split the initial states). Answers on the parts are merged in part order, so the result does not depend
+    on which worker finishes first. With the dfs engine the remaining parts are cancelled once every answer
+    is decided, so like a serial dfs run it does not report errors of the parts never read.
+    With a budget the frontier stays spilled, parts are read from it as the workers need them and at most
+    budget.memory models are sent to the workers at once.
+    """
+    query = replace(queries[0], engine=engine) if engine is not None else queries[0]
+    try:
+        start = 0
+        if query.engine in ('paths', 'dfs'):
+            # simulating no timepoint gives the initial models, spilled like any frontier with a budget
+            models = Query.run(query, stop=0)
+            timepoints = len(query.timepoints())
+            transitions = TransitionCache(query.scenario)
+            while len(models) < _SPLIT_FRONTIER and start < timepoints:
+                models = Query.run(query, transitions, models, start, start + 1)
+                start += 1
+            if engine_stats.current is not None:
+                engine_stats.current.cache_hits += transitions.hits
+                engine_stats.current.cache_misses += transitions.misses
+        else:
+            models = query.initial_models()
+    except Exception as e:
+        return [e] * len(queries)
+    if not len(models):
+        return list(run_batch(queries, engine=engine))
+
+    size = -(-len(models) // (workers * _PARTS_PER_WORKER))
+    # parts waiting for or in a worker, all of them without a budget
+    in_flight = len(models)
+    if query.budget is not None:
+        in_flight = min(2 * workers, query.budget.memory)
+        size = min(size, query.budget.memory // in_flight)
+    indices = list(range(len(queries)))
+    collect = engine_stats.current is not None
+    answers = [None] * len(queries)
+    partial = [[] for _ in queries]
+    undecided = set(indices)
+    futures = deque()
+    parts = _parts(models, size)
+    while undecided:
+        for part in parts:
+            futures.append(pool.submit(_run_branches, indices, part, start, engine, collect))
+            if len(futures) >= in_flight:
+                break
+        if not futures:
+            break
+        results, collected = futures.popleft().result()
+        _merge(collected)
+        for i in sorted(undecided):
+            if results[i] is None or answers[i] is not None:
+                continue
+            if isinstance(results[i], Exception):
+                answers[i] = results[i]
+            else:
+                partial[i].append(results[i])
+            if query.engine == 'dfs' and (answers[i] is not None or queries[i].decides(results[i])):
+                undecided.discard(i)
+    for future in futures:
+        future.cancel()
+    for i in indices:
+        if answers[i] is None:
+            answers[i] = queries[i].combine(partial[i]) if partial[i] else LogicException(NOT_REALIZABLE)
+    return answers
+
+
+def _parts(models: Iterable, size: int) -> Iterator[list]:
+    """models in lists of size, read one part at a time"""
+    part = []
+    for model in models:
+        part.append(model)
+        if len(part) == size:
+            yield part
+            part = []
+    if part:
+        yield part
+
+
+def _chunks(queries: list, engine: str = None) -> List[List[int]]:
+    """indices of the queries, queries sharing a simulation are kept in one chunk"""
+    chunks = {}
+    for i, query in enumerate(queries):
+        # streamed models are not shared, so those queries can run anywhere
+        streamed = (engine or query.engine) == 'dfs'
+        chunks.setdefault(query.key() if streamed else query.simulation_key(), []).append(i)
+    return list(chunks.values())
+
+
+def _run_checkpointed(queries: list, checkpoints: Checkpoints, engine: str = None) -> list:
+    """answers of the queries, simulations of the paths engine resume from the checkpoints"""
+    results = [None] * len(queries)
+    for indices in _chunks(queries, engine):
+        group = [queries[i] for i in indices]
+        query = replace(group[0], engine=engine) if engine is not None else group[0]
+        if query.engine != 'paths':
+            answers = run_batch(group, engine=engine)
+        else:
+            try:
+                models = checkpoints.simulate(query)
+                answers = run_batch(group, engine=engine, models=models, start=len(query.timepoints()))
+            except Exception as e:
+                answers = [e] * len(group)
+        for i, answer in zip(indices, answers):
+            results[i] = answer
+    return results
+
+
+def run_queries(
+        data: dict, engine: str = None, workers: int = 1, checkpoints: Checkpoints = None, stats: bool = False,
+        budget: FrontierBudget = None
+):
+    """Answers the queries of the data, in a pool of workers processes if workers > 1 (None for one per CPU).
+
+    Every worker gets the queries once and answers chunks of them, queries that all share one simulation
+    split its models between the workers instead. Tiny scenarios are always answered serially.
+    Serial simulations resume from the given checkpoints, which are updated with the new ones.
+    With stats, returns the Stats of the engine with the messages, workers included.
+    A budget bounds the frontier of every query in memory, see Query.run.
+    """
+    with _collecting(stats) as collected:
+        answers = _run_queries(data, engine, workers, checkpoints, budget)
+    results = {i + 1: _message(answer) for i, answer in enumerate(answers)}
+    return (results, collected) if stats else results
+
+
+def _run_queries(
+        data: dict, engine: str, workers: int, checkpoints: Optional[Checkpoints], budget: Optional[FrontierBudget]
+) -> list:
+    """answers of the queries of the data, a query that failed gets its exception instead"""
+    queries = data['queries'] if budget is None else [replace(query, budget=budget) for query in data['queries']]
+    chunks = _chunks(queries, engine)
+    workers = os.cpu_count() if workers is None else workers
+    work = len(data['scenario']) << len(data['states'])
+    serial = workers <= 1 or not queries or work < _PARALLEL_MIN_WORK
+    if serial and checkpoints is not None:
+        answers = _run_checkpointed(queries, checkpoints, engine)
+    elif serial:
+        answers = run_batch(queries, engine=engine)
+    elif len(chunks) < 2:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(queries,)) as pool:
+            answers = _run_split(pool, workers, queries, engine)
+    else:
+        answers = [None] * len(queries)
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker,
+                                 initargs=(queries,)) as pool:
+            results = pool.map(_run_chunk, chunks, repeat(engine), repeat(engine_stats.current is not None))
+            for indices, (chunk_answers, collected) in zip(chunks, results):
+                _merge(collected)
+                for i, answer in zip(indices, chunk_answers):
+                    answers[i] = answer
+    return answers
+
+
+def run_cached(
+        data: dict, cache: ResultCache = None, engine: str = None, workers: int = 1, bypass: bool = False,
+        budget: FrontierBudget = None
+):
+    """Answers the queries of scenario data as read from JSON, before parse_data, through the result cache.
+
+    Equivalent scenarios share their results, see scenario_hash. With bypass the queries are always run and
+    the cache is only updated. Results with unexpected or budget errors are not stored, the next run retries them.
+Without a cache the default one is opened for the call.
+    """
+    if cache is None:
+        cache = ResultCache()
         try:
-            msg = str(query.run())
-        except BackendException as e:
-            msg = getattr(e, 'message', repr(e))
-        except Exception as e:
-            print(traceback.format_exc())
-            msg = 'Something went wrong'
+            return run_cached(data, cache, engine, workers, bypass, budget)
         finally:
-            out[i+1] = msg
-    return out
+            cache.close()
+    key = scenario_hash(data, engine)
+    if not bypass:
+        results = cache.get(key)
+        if results is not None:
+            return results
+    answers = _run_queries(parse_data(data), engine, workers, None, budget)
+    results = {i + 1: _message(answer) for i, answer in enumerate(answers)}
+    if all(map(_storable, answers)):
+        cache.put(key, results)
+    return results
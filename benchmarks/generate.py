@@ -0,0 +1,98 @@
+"""Seeded generator of synthetic domains and scenarios, in the JSON saved by the application"""
+from __future__ import annotations
+
+import random
+from typing import List, Union
+
+Structure = Union[str, List]
+
+
+def generate(
+        seed: int = 0, fluents: int = 6, agents: int = 2, actions: int = 3, steps: int = 8, releases: int = 1,
+        disjunctive: int = 1, obs_density: float = 0.25, queries: int = 4
+) -> dict:
+    """Scenario data with a causes statement per action and agent, of which disjunctive have an 'or' effect,
+    release statements, an ACS at every one of steps timepoints and an OBS at each timepoint with probability
+    obs_density. The same arguments always give the same data."""
+    r = random.Random(seed)
+    states = [f'fluent {i}' for i in range(fluents)]
+    agent_names = [f'agent {i}' for i in range(agents)]
+    action_names = [f'action {i}' for i in range(actions)]
+
+    statements = []
+    affected = []
+    pairs = [(action, agent) for action in action_names for agent in agent_names]
+    for i, (action, agent) in enumerate(pairs):
+        # effects only on one or two fluents keep the scenarios realizable most of the time
+        names = r.sample(states, min(2, fluents))
+        effects = _literal(r, names[0])
+        if i < disjunctive and len(names) > 1:
+            effects = [effects, 'or', _literal(r, names[1])]
+        affected.append(names if i < disjunctive else names[:1])
+        condition = _literal(r, r.choice(states)) if r.random() < 0.5 else None
+        statements.append(_statement(action, agent, 'causes', effects, condition))
+    for _ in range(releases):
+        i = r.randrange(len(pairs))
+        # releasing a fluent the effect of the pair sets would make the statements disjoint
+        free = [name for name in states if name not in affected[i]] or states
+        statements.append(_statement(*pairs[i], 'releases', r.choice(free), None))
+
+    acs = [{'action': r.choice(action_names), 'agent': r.choice(agent_names), 'time': t} for t in range(1, steps + 1)]
+    obs = [_obs(r, states, 0, 1)]
+    obs += [_obs(r, states, t, 2) for t in range(1, steps + 1) if r.random() < obs_density]
+
+    query_data = []
+    for i in range(queries):
+        time = r.randint(0, steps + 1)
+        if i % 3 == 0:
+            condition = _literal(r, r.choice(states))
+            kind = r.choice(['necessary', 'possibly'])
+            query_data.append({
+                'original_expression': f'{kind} {_text(condition)} at {time} when sc', 'query_type': 'fluent',
+                'concrete_query': {'kind': kind, 'condition': condition, 'time': time}
+            })
+        elif i % 3 == 1:
+            action, agent = r.choice(pairs)
+            query_data.append({
+                'original_expression': f'necessary {action} by {agent} at {time} when sc', 'query_type': 'action',
+                'concrete_query': {'action': action, 'agent': agent, 'time': time}
+            })
+        else:
+            agent = r.choice(agent_names)
+            query_data.append({
+                'original_expression': f'agent {agent} is active when sc', 'query_type': 'agent',
+                'concrete_query': {'agent': agent}
+            })
+
+    return {
+        'AGENT': agent_names, 'ACTION': action_names, 'STATE': states,
+        'TIME': {'unit': 'h', 'step': 1, 'termination': steps + 1},
+        'ACS': acs, 'OBS': obs, 'STATEMENT': statements, 'QUERY': query_data,
+    }
+
+
+def _literal(r: random.Random, name: str) -> Structure:
+    return name if r.random() < 0.5 else ['not', name]
+
+
+def _text(structure: Structure) -> str:
+    if isinstance(structure, str):
+        return structure
+    return ' '.join(_text(el) for el in structure)
+
+
+def _statement(action: str, agent: str, kind: str, effects: Structure, condition: Structure | None) -> dict:
+    text = f'{action} by {agent} {kind} {_text(effects)}' + (f' if {_text(condition)}' if condition else '')
+    return {
+        'original_expression': text, 'action': action, 'agent': agent, 'statement_type': kind,
+        'effects': effects, 'condition': condition,
+    }
+
+
+def _obs(r: random.Random, states: List[str], time: int, width: int) -> dict:
+    """OBS of a disjunction of width literals, so later observations rarely contradict the scenario"""
+    literals = [_literal(r, name) for name in r.sample(states, min(width, len(states)))]
+    formula = literals[0]
+    for literal in literals[1:]:
+        formula = [formula, 'or', literal]
+    return {'original_expression': _text(formula), 'parsed_expression': [formula], 'time': time}
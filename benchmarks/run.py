@@ -0,0 +1,172 @@
+"""Benchmarks of the simulation on synthetic scenarios and the example scenarios of the repository.
+
+    python -m benchmarks.run [--output FILE] [--baseline FILE] [--threshold 0.5] [--repeat 5] [--only NAME]
+
+Records wall time, peak memory and model counts of every case to a JSON file. With a baseline, exits with 1 if
+a time or peak memory of a case grew by more than the threshold, or if a model count changed.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from backend.base import Query, MaskObs, EffectStatement
+from backend.cache import ENGINE_VERSION
+from backend.master import parse_data, run_queries
+from benchmarks.generate import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+BASE = dict(fluents=6, agents=2, actions=3, steps=8, releases=1, disjunctive=1, obs_density=0.25)
+# every parameter of the generator varied on its own from the base case
+VARIANTS = dict(
+    fluents=[4, 9], agents=[1, 4], actions=[1, 6], steps=[4, 14], releases=[0, 3], disjunctive=[0, 4],
+    obs_density=[0.0, 0.75],
+)
+# slowdowns of less than this many seconds are noise
+_MIN_SECONDS = 1e-2
+# so is growth of less than this many bytes of peak memory, it depends on the caches earlier cases warmed
+_MIN_BYTES = 1 << 16
+
+
+def cases() -> Dict[str, dict]:
+    """scenario data of every case by name"""
+    out = {'base': generate(**BASE)}
+    for name, values in VARIANTS.items():
+        for value in values:
+            out[f'{name}={value}'] = generate(**{**BASE, name: value})
+    for path in sorted(glob.glob(os.path.join(ROOT, '*.json'))):
+        with open(path) as f:
+            out[f'example:{os.path.basename(path)}'] = json.load(f)
+    return out
+
+
+def _timed(function: Callable, repeat: int) -> Tuple[float, object]:
+    """best wall time of the function over repeat calls and its result"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        # collections triggered by earlier runs would be timed otherwise
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = function()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best, result
+
+
+def _possibilities(data: dict) -> int:
+    """enumerates the assignments of every formula of the scenario"""
+    formulas = [_statement.precondition for _statement in data['statements']]
+    formulas += [_statement.formula for _statement in data['statements'] if isinstance(_statement, EffectStatement)]
+    formulas += [timepoint.obs.formula for timepoint in data['scenario'].timepoints.values() if timepoint.is_obs()]
+    return sum(len(formula.get_all_possibilities()) for formula in formulas)
+
+
+def _transitions(data: dict) -> int:
+    """runs every action of the scenario by its agent on every initial state with Action.step"""
+    scenario = data['scenario']
+    first_obs: List[MaskObs] = scenario.get_first_obs(data['states'])
+    count = 0
+    for timepoint in scenario.timepoints.values():
+        if timepoint.is_acs():
+            action, agent = timepoint.acs
+            effects, releases = scenario.get_statements(action, agent)
+            for obs in first_obs:
+                count += len(action.step(obs, effects, releases))
+    return count
+
+
+def measure(data: dict, repeat: int) -> dict:
+    """wall times of a case, its peak traced memory and model counts, up to the error of the case if any"""
+    out = {}
+    try:
+        out['queries_seconds'], _ = _timed(lambda: run_queries(parse_data(data)), repeat)
+        # traced separately, tracing slows down the timed runs
+        tracemalloc.start()
+        try:
+            run_queries(parse_data(data))
+            out['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        parsed = parse_data(data)
+        out['possibilities_seconds'], out['possibilities'] = _timed(lambda: _possibilities(parsed), repeat)
+        out['action_run_seconds'], out['transitions'] = _timed(lambda: _transitions(parsed), repeat)
+        query = Query(scenario=parsed['scenario'], termination=parsed['termination'], states=parsed['states'])
+        out['simulate_seconds'], models = _timed(lambda: Query.run(query), repeat)
+        out['models'] = len(models)
+    except Exception as e:
+        out['error'] = getattr(e, 'message', repr(e))
+    return out
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """regressions of the current results against the baseline, cases missing from either are skipped"""
+    out = []
+    for name, metrics in current['cases'].items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            continue
+        for key, value in metrics.items():
+            old = before.get(key)
+            if old is None:
+                continue
+            if key.endswith('_seconds'):
+                if value > old * (1 + threshold) and value - old > _MIN_SECONDS:
+                    out.append(f'{name}: {key} {old:.4f} -> {value:.4f}')
+            elif key == 'peak_bytes':
+                if value > old * (1 + threshold) and value - old > _MIN_BYTES:
+                    out.append(f'{name}: {key} {old} -> {value}')
+            elif value != old:
+                out.append(f'{name}: {key} changed {old!r} -> {value!r}')
+    return out
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=None, help='JSON file of the results, printed by default')
+    parser.add_argument('--baseline', default=None, help=f'JSON file to compare with, e.g. {BASELINE}')
+    parser.add_argument('--threshold', type=float, default=0.5, help='allowed relative growth of time and memory')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of every measurement, the best is kept')
+    parser.add_argument('--only', default=None, help='only cases with names containing this text')
+    args = parser.parse_args(argv)
+
+    results = {
+        'engine_version': ENGINE_VERSION, 'python': platform.python_version(), 'machine': platform.machine(),
+        'cases': {},
+    }
+    for name, data in cases().items():
+        if args.only is None or args.only in name:
+            results['cases'][name] = measure(data, args.repeat)
+            print(name, results['cases'][name], file=sys.stderr)
+
+    text = json.dumps(results, indent=1, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for line in regressions:
+        print('regression', line, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,9 @@
 import os,sys
 
 import PySimpleGUI as sg
-from frontend.utils import get_default_location, create_literal_parser, create_logic_parser
+from frontend.utils import get_default_location, create_literal_parser, create_logic_parser, clear_parser_cache
 from frontend.data import ACS, OBS, Statement, Query
-from backend.base import BackendException
+from backend.base import BackendException, Checkpoints
 from backend import parse_data, run_queries
 
 import traceback
@@ -64,6 +64,7 @@ class CollectionManager:
             return
         element = self.preprocess_element(element, **kwargs)
         self.contents.append(element)
+        self.contents_changed()
         self.update(window)
 
     def validate_remove(self, element):
@@ -77,8 +78,12 @@ class CollectionManager:
         if not self.validate_remove(element_number):
             return
         self.contents.pop(int(element_number)-1)
+        self.contents_changed()
         self.update(window)
 
+    def contents_changed(self):
+        pass
+
 class SimpleCollectionManager(CollectionManager):
     def __init__(self, content_name ):
         super().__init__(f"-{content_name}-")
@@ -149,17 +154,26 @@ class SimpleCollectionManager(CollectionManager):
     def update(self, window):
         return super().update(window)
 
-class AgentManager(SimpleCollectionManager):
+class NameManager(SimpleCollectionManager):
+    def set_data(self, data):
+        super().set_data(data)
+        self.contents_changed()
+
+    def contents_changed(self):
+        # grammars are cached by the names, the ones of the old names are not needed anymore
+        clear_parser_cache()
+
+class AgentManager(NameManager):
     def __init__(self):
         super().__init__("AGENT")
         self.display = self.display + [[sg.Text(f"To add an agent, type the name into the text field and press the 'Add' button.\nTo remove an agent, press the 'Remove' button to open the removal dialog.")]]
 
-class ActionManager(SimpleCollectionManager):
+class ActionManager(NameManager):
     def __init__(self):
         super().__init__("ACTION")
         self.display = self.display + [[sg.Text(f"To add an action, type the name into the text field and press the 'Add' button.\nTo remove an action, press the 'Remove' button to open the removal dialog.")]]
 
-class StateManager(SimpleCollectionManager):
+class StateManager(NameManager):
     def __init__(self):
         super().__init__("STATE")
         self.display = self.display + [[sg.Text(f"To add a fluent, type the name into the text field and press the 'Add' button.\nTo remove a fluent, press the 'Remove' button to open the removal dialog.")]]
@@ -589,6 +603,8 @@ class ScenarioManager:
         self.run_query_button_key = "-SCENARIO-RUN-QUERY-BUTTON-"
         self.run_query_results = "-SCENARIO-RESULTS-"
         self.manager_manager = manager_manager
+        # models after every timepoint of the last run, a re-run after an edit resumes before the edited timepoint
+        self.checkpoints = Checkpoints()
         # self.scenario_compile_status = "not compiled"
         self.display = [
             [
@@ -623,7 +639,7 @@ class ScenarioManager:
     def run_query_button_func(self, window):
         try:
             data: dict = parse_data(data=self.manager_manager.data())
-            results: dict = run_queries(data)
+            results: dict = run_queries(data, checkpoints=self.checkpoints)
             msg = "\n".join(f'{k:>3}. {v}' for k,v in results.items())
         except BackendException as e:
             msg = getattr(e, 'message', repr(e))
@@ -1,6 +1,14 @@
+from functools import lru_cache
+
 import pyparsing as pp
 import PySimpleGUI as sg
 
+# the infix grammar tries every operator level at every position, memoising the parse results avoids redoing it
+pp.ParserElement.enable_packrat()
+
+# grammars are built once per tuple of names, a few vocabularies are kept while the user edits the scenario
+GRAMMAR_CACHE_SIZE = 32
+
 def get_default_location():
     return (100,100)
 
@@ -16,7 +24,19 @@ def parse_logic(expression, states):
         return False
     return parsed_expression
 
+def clear_parser_cache():
+    _literal_parser.cache_clear()
+    _logic_parser.cache_clear()
+
 def create_literal_parser(literals):
+    # callers name and combine the grammar, the copy keeps the cached one intact
+    return _literal_parser(tuple(literals)).copy()
+
+def create_logic_parser(states):
+    return _logic_parser(tuple(states)).copy()
+
+@lru_cache(maxsize=GRAMMAR_CACHE_SIZE)
+def _literal_parser(literals):
     quoted_literal = (pp.Suppress("'") | pp.Suppress("\"")) + pp.Keyword(literals[0]) + (pp.Suppress("'") | pp.Suppress("\""))
     literal_parser = pp.Keyword(literals[0]) | quoted_literal
     for state in literals[1:]:
@@ -24,7 +44,8 @@ def create_literal_parser(literals):
         literal_parser |= pp.Keyword(state) | quoted_literal
     return literal_parser
 
-def create_logic_parser(states):
+@lru_cache(maxsize=GRAMMAR_CACHE_SIZE)
+def _logic_parser(states):
     quoted_literal = (pp.Suppress("'") | pp.Suppress("\"")) + pp.Keyword(states[0]) + (pp.Suppress("'") | pp.Suppress("\""))
     states_parser = pp.Keyword(states[0]) | quoted_literal
     for state in states[1:]: